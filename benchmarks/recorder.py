@@ -0,0 +1,58 @@
+"""Measure the throughput of the recorder on a flood of output
+
+A command writing SIZE bytes as fast as it can (`yes` cut by `head`) is
+recorded with record_session(), its output being forwarded to /dev/null and
+its input being a pipe that stays silent. The best of several runs is
+reported in MB/s of recorded output, with the number of events recorded.
+
+    python benchmarks/recorder.py [--size MB] [--runs N]
+
+To compare with another version of the recorder, run the script from a
+checkout of that version, e.g. a git worktree of the previous commit.
+"""
+import argparse
+import os
+import sys
+import time
+
+from termcap.recorder.core import record_session
+
+
+def measure(size):
+    """Return the duration, the recorded bytes and the events of one recording"""
+    command = ["sh", "-c", f"yes | head -c {size}"]
+    input_read, input_write = os.pipe()
+    output_fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        start = time.perf_counter()
+        records = record_session(command, 80, 24, input_read, output_fd)
+        next(records)
+        recorded = events = 0
+        for event in records:
+            recorded += len(event.event_data.encode("utf-8"))
+            events += 1
+        duration = time.perf_counter() - start
+    finally:
+        for fd in (input_read, input_write, output_fd):
+            os.close(fd)
+    return duration, recorded, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100, help="output of the command in MB (default: 100)")
+    parser.add_argument("--runs", type=int, default=3, help="number of runs (default: 3)")
+    options = parser.parse_args()
+
+    size = options.size * 1_000_000
+    results = [measure(size) for _ in range(options.runs)]
+    duration, recorded, events = min(results)
+    if recorded < size:
+        print(f"Only {recorded} of {size} bytes were recorded", file=sys.stderr)
+        sys.exit(1)
+    print(f"{recorded / duration / 1_000_000:.1f} MB/s, {events} events "
+          f"(best of {options.runs}, {options.size} MB)")
+
+
+if __name__ == "__main__":
+    main()
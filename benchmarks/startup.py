@@ -0,0 +1,63 @@
+"""Measure the startup time of each termcap subcommand
+
+Each command line runs in a new interpreter with --help, so that only
+imports, command registration and option parsing are measured. The
+configuration, cache and data directories point to an empty temporary
+directory, which must still be empty afterwards.
+
+    python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = [
+    ["--version"],
+    ["--help"],
+    ["record", "--help"],
+    ["replay", "--help"],
+    ["render", "--help"],
+    ["render-batch", "--help"],
+    ["config", "show"],
+    ["template", "list"],
+    ["cache", "--help"],
+]
+
+
+def measure(command, env, runs):
+    """Return the median wall time of command in seconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="runs per command (default: 10)")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, "config"),
+                   XDG_CACHE_HOME=os.path.join(home, "cache"), XDG_DATA_HOME=os.path.join(home, "data"))
+        # Startup of a bare interpreter, for reference
+        interpreter = measure([sys.executable, "-c", "pass"], env, options.runs)
+        print(f"{'(python -c pass)':<24} {interpreter * 1000:7.1f} ms")
+        for args in COMMANDS:
+            timing = measure([sys.executable, "-m", "termcap.cli", *args], env, options.runs)
+            print(f"{' '.join(args):<24} {timing * 1000:7.1f} ms")
+
+        written = [os.path.join(root, name) for root, dirs, files in os.walk(home) for name in dirs + files]
+        if written:
+            print(f"Startup wrote to the filesystem: {', '.join(written)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
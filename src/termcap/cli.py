@@ -1,10 +1,22 @@
 """Click-based CLI for termcap"""
 import click
 
-from termcap.commands import register_commands
+from termcap.commands import LAZY_COMMANDS, load_register_function
 
 
-@click.group(invoke_without_command=True)
+class LazyGroup(click.Group):
+    """Group registering each command the first time it is looked up"""
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(LAZY_COMMANDS))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in LAZY_COMMANDS:
+            load_register_function(cmd_name)(self)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, invoke_without_command=True)
 @click.option("--version", is_flag=True, help="Show version and exit")
 @click.pass_context
 def main(ctx, version):
@@ -22,8 +34,5 @@ def main(ctx, version):
         return
 
 
-register_commands(main)
-
-
 if __name__ == "__main__":
     main()
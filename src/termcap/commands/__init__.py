@@ -1,13 +1,20 @@
-from termcap.commands.config import register_config_commands
-from termcap.commands.record import register_record_command
-from termcap.commands.render import register_render_command
-from termcap.commands.replay import register_replay_command
-from termcap.commands.template import register_template_commands
+import importlib
 
+# Command name -> module and function registering it, imported only when the
+# command is used so that every command does not pay for the dependencies of
+# the others
+LAZY_COMMANDS = {
+    "record": "termcap.commands.record:register_record_command",
+    "replay": "termcap.commands.replay:register_replay_command",
+    "render": "termcap.commands.render:register_render_command",
+    "render-batch": "termcap.commands.render:register_render_command",
+    "convert": "termcap.commands.convert:register_convert_command",
+    "config": "termcap.commands.config:register_config_commands",
+    "template": "termcap.commands.template:register_template_commands",
+    "cache": "termcap.commands.cache:register_cache_commands",
+}
 
-def register_commands(main):
-    register_record_command(main)
-    register_replay_command(main)
-    register_render_command(main)
-    register_config_commands(main)
-    register_template_commands(main)
+
+def load_register_function(name):
+    module_name, function_name = LAZY_COMMANDS[name].split(":")
+    return getattr(importlib.import_module(module_name), function_name)
@@ -0,0 +1,60 @@
+import sys
+
+import click
+
+from termcap.renderer.cache import RenderCache
+
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(value):
+    """Parse a size in bytes such as 500, 200K, 50M or 1G"""
+    value = value.strip().upper().rstrip("B")
+    unit = value[-1:] if value[-1:] in _SIZE_UNITS else ""
+    try:
+        return int(float(value[:len(value) - len(unit)]) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise click.BadParameter(f"Invalid size: {value}")
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def register_cache_commands(main):
+    @main.group()
+    def cache():
+        pass
+
+    @cache.command("info")
+    def cache_info():
+        render_cache = RenderCache()
+        entries = render_cache.entries()
+        click.echo(f"Cache directory: {render_cache.directory}")
+        click.echo(f"Entries: {len(entries)}")
+        click.echo(f"Size: {format_size(sum(entry.size for entry in entries))}")
+
+    @cache.command("evict")
+    @click.option("--max-size", callback=lambda ctx, param, value: value and parse_size(value),
+                  help="Remove least recently used entries until the cache is smaller than this (e.g. 200M)")
+    @click.option("--max-entries", type=click.IntRange(min=0),
+                  help="Remove least recently used entries until at most this many remain")
+    @click.option("--max-age", type=click.FloatRange(min=0),
+                  help="Remove entries not used for this many days")
+    def cache_evict(max_size, max_entries, max_age):
+        if max_size is None and max_entries is None and max_age is None:
+            click.echo("Error: give at least one of --max-size, --max-entries and --max-age", err=True)
+            sys.exit(1)
+        removed = RenderCache().evict(
+            max_size, max_entries, None if max_age is None else max_age * 86400
+        )
+        click.echo(f"Removed {len(removed)} entries ({format_size(sum(entry.size for entry in removed))})")
+
+    @cache.command("clear")
+    def cache_clear():
+        removed = RenderCache().clear()
+        click.echo(f"Removed {len(removed)} entries ({format_size(sum(entry.size for entry in removed))})")
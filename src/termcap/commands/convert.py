@@ -0,0 +1,58 @@
+import os
+import sys
+
+import click
+from rich.console import Console
+
+from termcap.parser.asciicast import ReadStats, open_cast_output
+from termcap.parser.formats import open_event_reader, read_records
+from termcap.parser import tcap
+
+
+def convert(input_path, output_path, codec="zlib", stats=None):
+    """Convert a cast between the asciicast and .tcap formats
+
+    The format of the output is chosen by its extension, casts ending in .gz
+    or .xz being compressed. The format of the input is detected. Return the
+    number of events written.
+    """
+    header_line = open_event_reader(input_path).header_line
+    records = read_records(input_path, stats)
+    next(records)
+    if output_path.endswith(".tcap"):
+        return tcap.write_tcap(output_path, header_line, records, codec)
+
+    count = 0
+    with open_cast_output(output_path) as cast_file:
+        cast_file.write(header_line.decode("utf-8").rstrip("\n") + "\n")
+        for record in records:
+            cast_file.write(record.to_json_line() + "\n")
+            count += 1
+    return count
+
+
+def register_convert_command(main):
+    @main.command("convert")
+    @click.argument("input_file", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("output_file", type=click.Path(dir_okay=False))
+    @click.option("--codec", type=click.Choice(tcap.CODECS), default="zlib", show_default=True,
+                  help="Compression of the chunks of a .tcap output")
+    def convert_command(input_file, output_file, codec):
+        """Convert INPUT_FILE to OUTPUT_FILE, writing .tcap if OUTPUT_FILE ends with .tcap"""
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            click.echo("Error: the output file must differ from the input file", err=True)
+            sys.exit(1)
+        stats = ReadStats()
+        try:
+            count = convert(input_file, output_file, codec, stats)
+        except ValueError as e:
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
+        if stats.malformed_lines:
+            click.echo(f"Warning: skipped {stats.malformed_lines} malformed lines", err=True)
+        console = Console()
+        console.print(
+            f"✓ 转换完成，共 {count} 个事件，"
+            f"{os.path.getsize(input_file)} 字节 → {os.path.getsize(output_file)} 字节"
+        )
+        console.print(f"Conversion ended, output file is {output_file}", markup=False)
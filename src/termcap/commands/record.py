@@ -7,7 +7,9 @@ from rich.console import Console
 from rich.panel import Panel
 
 from termcap.commands.common import get_default_settings
+from termcap.parser.asciicast import open_cast_output
 from termcap.recorder.core import record_session
+from termcap.recorder.writer import DEFAULT_COALESCE_WINDOW, CastWriter
 from termcap.recorder.terminal import TerminalMode, get_terminal_size
 
 
@@ -16,7 +18,13 @@ def register_record_command(main):
     @click.argument("output_path", required=False)
     @click.option("-c", "--command", help="Program to record (default: $SHELL)")
     @click.option("-g", "--geometry", help="Terminal geometry (WIDTHxHEIGHT)")
-    def record(output_path, command, geometry):
+    @click.option("-z", "--compress", type=click.Choice(["gz", "xz"]),
+                  help="Compress the cast while recording, adding the extension to OUTPUT_PATH "
+                       "(casts ending in .gz or .xz are always compressed)")
+    @click.option("--coalesce", type=click.FloatRange(min=0), default=DEFAULT_COALESCE_WINDOW * 1000,
+                  show_default=True,
+                  help="Merge output arriving within this many milliseconds into one event (0 to disable)")
+    def record(output_path, command, geometry, compress, coalesce):
         defaults = get_default_settings()
 
         if command is None:
@@ -24,6 +32,8 @@ def register_record_command(main):
         if output_path is None:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             output_path = f"termcap_{timestamp}.cast"
+        if compress and not output_path.endswith(f".{compress}"):
+            output_path += f".{compress}"
 
         if geometry:
             try:
@@ -45,16 +55,18 @@ def register_record_command(main):
         )
 
         start_time = time.time()
-        count = 0
 
         with TerminalMode(sys.stdin.fileno()):
-            records = record_session(process_args, columns, lines, sys.stdin.fileno(), sys.stdout.fileno())
-            with open(output_path, "w") as cast_file:
-                header = next(records)
-                print(header.to_json_line(), file=cast_file)
+            with open_cast_output(output_path) as cast_file, \
+                    CastWriter(cast_file, coalesce_window=coalesce / 1000) as writer:
+                records = record_session(
+                    process_args, columns, lines, sys.stdin.fileno(), sys.stdout.fileno(),
+                    tick=writer.flush_if_due, tick_interval=writer.flush_interval,
+                )
+                writer.write_header(next(records))
                 for record_item in records:
-                    print(record_item.to_json_line(), file=cast_file)
-                    count += 1
+                    writer.write_event(record_item)
+        count = writer.events
 
         duration = time.time() - start_time
         console.print(f"✓ 录制完成，时长: {duration:.1f}秒，共 {count} 个事件")
@@ -1,3 +1,6 @@
+import glob
+import os
+import shutil
 import sys
 from pathlib import Path
 
@@ -5,8 +8,58 @@ import click
 from rich.console import Console
 
 from termcap.commands.common import get_default_settings
-from termcap.parser.asciicast import read_records
-from termcap.renderer import render_animation, render_still_frames
+from termcap.parser.asciicast import COMPRESSED_SUFFIXES, ReadStats
+from termcap.parser.formats import read_records
+from termcap.renderer import (
+    arrays, compression, keyframes, render_animation_incremental, render_animations, render_still_frames,
+    theme
+)
+from termcap.renderer.batch import BatchJob, render_batch
+from termcap.renderer.cache import RenderCache, animation_options, cache_key
+
+
+def parse_time(value):
+    """Parse a time of the recording such as 01:55:00, 5:30 or 90.5 in seconds"""
+    seconds = 0.0
+    try:
+        for part in value.split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise click.BadParameter(f"Invalid time: {value}")
+    if seconds < 0 or value.count(":") > 2:
+        raise click.BadParameter(f"Invalid time: {value}")
+    return seconds
+
+
+def expand_inputs(inputs):
+    """Return the casts matching inputs: files, directories or glob patterns"""
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(
+                str(path) for path in Path(pattern).rglob("*")
+                if _cast_name(path).suffix in (".cast", ".tcap")
+            ))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            paths.append(pattern)
+    # Keep the first occurrence of each cast
+    return list(dict.fromkeys(paths))
+
+
+def _cast_name(path):
+    """Return path without the extension of compressed casts, if any"""
+    return path.with_suffix("") if path.suffix in COMPRESSED_SUFFIXES else path
+
+
+def _warn_malformed_lines(read_stats):
+    if read_stats.malformed_lines:
+        lines = ", ".join(map(str, read_stats.malformed_line_numbers))
+        if read_stats.malformed_lines > len(read_stats.malformed_line_numbers):
+            lines += ", ..."
+        click.echo(f"Warning: skipped {read_stats.malformed_lines} malformed lines of the cast (lines {lines})",
+                   err=True)
 
 
 def register_render_command(main):
@@ -17,12 +70,65 @@ def register_render_command(main):
     @click.option("-m", "--min-duration", type=int, help="Minimum frame duration (ms)")
     @click.option("-M", "--max-duration", type=int, help="Maximum frame duration (ms)")
     @click.option("-s", "--still-frames", is_flag=True, help="Output still frames instead of animation")
-    @click.option("-t", "--template", help="SVG template to use")
-    def render(input_file, output_path, loop_delay, min_duration, max_duration, still_frames, template):
+    @click.option(
+        "-t", "--template", "templates", multiple=True,
+        help="SVG template to use, several comma separated or repeated templates render one animation each",
+    )
+    @click.option(
+        "-j", "--jobs", type=click.IntRange(min=1), default=1,
+        help="Number of processes rendering still frames (default: 1)",
+    )
+    @click.option(
+        "--array-frames", is_flag=True,
+        help="Compare frames as NumPy arrays, faster for wide and mostly static screens",
+    )
+    @click.option(
+        "--row-lifetimes", is_flag=True,
+        help="Show each row only while it is on screen instead of scrolling through stacked frames",
+    )
+    @click.option(
+        "--max-fps", type=click.FloatRange(min=0, min_open=True),
+        help="Maximum number of frames per second",
+    )
+    @click.option(
+        "--max-frames", type=click.IntRange(min=1),
+        help="Maximum number of frames, merging the least noticeable ones",
+    )
+    @click.option("-z", "--compress", is_flag=True, help="Write gzip compressed SVG (.svgz)")
+    @click.option(
+        "--sidecar", "sidecars", type=click.Choice(compression.SIDECAR_FORMATS), multiple=True,
+        help="Also write a compressed copy of the animation for static hosting (repeatable)",
+    )
+    @click.option(
+        "--compact", is_flag=True,
+        help="Use generated CSS classes, short ids and inlined definitions for smaller animations",
+    )
+    @click.option("--no-cache", is_flag=True, help="Render even if the animation is in the cache")
+    @click.option(
+        "--checkpoint", is_flag=True,
+        help="Save a checkpoint next to the output and resume from it if the cast only grew since",
+    )
+    @click.option(
+        "--from", "start", callback=lambda ctx, param, value: value and parse_time(value),
+        help="Render from this time of the recording (HH:MM:SS, MM:SS or seconds)",
+    )
+    @click.option(
+        "--to", "end", callback=lambda ctx, param, value: value and parse_time(value),
+        help="Render up to this time of the recording (HH:MM:SS, MM:SS or seconds)",
+    )
+    @click.option(
+        "--keyframe-interval", type=click.FloatRange(min=0, min_open=True), default=keyframes.DEFAULT_INTERVAL,
+        show_default=True,
+        help="Seconds between the keyframes indexed in the cache to start rendering at --from",
+    )
+    def render(input_file, output_path, loop_delay, min_duration, max_duration, still_frames, templates, jobs,
+               array_frames, row_lifetimes, max_fps, max_frames, compress, sidecars,
+               compact, no_cache, checkpoint, start, end, keyframe_interval):
         defaults = get_default_settings()
 
-        if template is None:
-            template = defaults["template"]
+        templates = list(dict.fromkeys(name for value in templates for name in value.split(",") if name))
+        if not templates:
+            templates = [defaults["template"]]
         if min_duration is None:
             min_duration = defaults["min_duration"]
         if max_duration is None:
@@ -30,44 +136,263 @@ def register_render_command(main):
         if loop_delay is None:
             loop_delay = defaults["loop_delay"]
 
+        if still_frames:
+            animation_only = [
+                name for name, value in [
+                    ("--array-frames", array_frames), ("--row-lifetimes", row_lifetimes),
+                    ("--sidecar", sidecars), ("--compact", compact), ("--checkpoint", checkpoint),
+                ] if value
+            ]
+            if animation_only:
+                raise click.UsageError(
+                    f"{', '.join(animation_only)} cannot be used with --still-frames"
+                )
+        if array_frames and not arrays.available():
+            click.echo("Error: --array-frames requires NumPy (pip install termcap[arrays])", err=True)
+            sys.exit(1)
+        if "br" in sidecars and not compression.brotli_available():
+            click.echo("Error: --sidecar br requires brotli (pip install termcap[compression])", err=True)
+            sys.exit(1)
+        if compress and not still_frames and output_path is not None \
+                and not compression.is_compressed_path(output_path):
+            click.echo("Error: --compress requires an output path ending in .svgz", err=True)
+            sys.exit(1)
+        if "gz" in sidecars and (compress or output_path is not None
+                                 and compression.is_compressed_path(output_path)):
+            click.echo("Error: --sidecar gz cannot be used with compressed output", err=True)
+            sys.exit(1)
+        if checkpoint and (array_frames or max_frames):
+            click.echo("Error: --checkpoint cannot be used with --array-frames or --max-frames", err=True)
+            sys.exit(1)
+        windowed = start is not None or end is not None
+        if checkpoint and windowed:
+            click.echo("Error: --checkpoint cannot be used with --from or --to", err=True)
+            sys.exit(1)
+        if windowed and start is not None and end is not None and end <= start:
+            click.echo("Error: --to must be later than --from", err=True)
+            sys.exit(1)
+        if len(templates) > 1 and (still_frames or checkpoint):
+            click.echo("Error: several templates cannot be used with --still-frames or --checkpoint", err=True)
+            sys.exit(1)
+        template_contents = {template: theme.load_template(template) for template in templates}
+        for template, template_content in template_contents.items():
+            if template_content is None:
+                click.echo(f"Error: Template '{template}' not found", err=True)
+                sys.exit(1)
+
         if output_path is None:
             input_path = Path(input_file)
             if still_frames:
-                output_path = str(input_path.parent / f"{input_path.stem}_frames")
+                output_path = str(input_path.parent / f"{_cast_name(input_path).stem}_frames")
             else:
-                output_path = str(input_path.with_suffix(".svg"))
+                output_path = str(_cast_name(input_path).with_suffix(".svgz" if compress else ".svg"))
+        if len(templates) > 1:
+            # One animation per template, named after the template
+            base_path = Path(output_path)
+            outputs = [
+                (str(base_path.with_name(f"{base_path.stem}_{template}{base_path.suffix}")), template)
+                for template in templates
+            ]
+        else:
+            outputs = [(output_path, templates[0])]
+
+        # Still frames and sidecars are several files, only single animations are
+        # cached. Checkpoints and windows avoid processing the whole cast, which
+        # hashing it for the cache key would do.
+        render_cache = None
+        keys = {}
+        if not (no_cache or still_frames or sidecars or checkpoint or windowed):
+            render_cache = RenderCache()
+            for path, template in outputs:
+                keys[path] = cache_key(input_file, template_contents[template], animation_options(
+                    path, min_duration, max_duration, loop_delay, row_lifetimes, max_fps, max_frames,
+                    compress, compact,
+                ))
+            cached_outputs = []
+            for path, template in outputs:
+                cached_path = render_cache.get(keys[path])
+                if cached_path is not None:
+                    shutil.copyfile(cached_path, path)
+                    click.echo(f"Rendering skipped (cached), SVG animation is {path}")
+                    cached_outputs.append((path, template))
+            outputs = [output for output in outputs if output not in cached_outputs]
+            if not outputs:
+                return
 
         console = Console()
-        records_iter = read_records(input_file)
-        try:
-            header = next(records_iter)
-        except StopIteration:
-            click.echo("Error: Empty input file", err=True)
-            sys.exit(1)
+        screen = None
+        read_stats = ReadStats()
+        if windowed:
+            try:
+                with console.status("正在定位起始关键帧...", spinner="dots"):
+                    header, screen, records_iter = keyframes.read_window(
+                        input_file, start or 0, end, keyframe_interval
+                    )
+            except ValueError as e:
+                click.echo(f"Error: {e}", err=True)
+                sys.exit(1)
+        else:
+            records_iter = read_records(input_file, read_stats)
+            try:
+                header = next(records_iter)
+            except StopIteration:
+                click.echo("Error: Empty input file", err=True)
+                sys.exit(1)
 
         if still_frames:
             with console.status("正在渲染 SVG...", spinner="dots"):
-                render_still_frames(
+                summary = render_still_frames(
                     records_iter,
                     header,
                     output_path,
-                    template,
+                    templates[0],
                     min_duration,
                     max_duration,
                     loop_delay,
+                    jobs,
+                    max_fps,
+                    max_frames,
+                    compress,
+                    screen,
                 )
-            console.print("✓ 渲染完成")
+            console.print(
+                f"✓ 渲染完成，共 {summary.frames} 帧（{summary.unique_frames} 帧不重复），"
+                f"行缓存命中率 {summary.line_cache_hit_rate:.1%}"
+            )
+            _warn_malformed_lines(read_stats)
             click.echo(f"Rendering ended, SVG frames are located at {output_path}")
         else:
             with console.status("正在渲染 SVG...", spinner="dots"):
-                render_animation(
-                    records_iter,
-                    header,
-                    output_path,
-                    template,
-                    min_duration,
-                    max_duration,
-                    loop_delay,
-                )
-            console.print("✓ 渲染完成")
-            click.echo(f"Rendering ended, SVG animation is {output_path}")
+                if checkpoint:
+                    summary = render_animation_incremental(
+                        input_file,
+                        output_path,
+                        templates[0],
+                        min_duration,
+                        max_duration,
+                        loop_delay,
+                        row_lifetimes,
+                        max_fps,
+                        compress,
+                        sidecars,
+                        compact,
+                    )
+                else:
+                    summary = render_animations(
+                        records_iter,
+                        header,
+                        outputs,
+                        min_duration,
+                        max_duration,
+                        loop_delay,
+                        array_frames,
+                        row_lifetimes,
+                        max_fps,
+                        max_frames,
+                        compress,
+                        sidecars,
+                        compact,
+                        screen,
+                    )
+            console.print(
+                f"✓ 渲染完成，共 {summary.frames} 帧（{summary.unique_frames} 帧不重复），"
+                f"行缓存命中率 {summary.line_cache_hit_rate:.1%}"
+            )
+            _warn_malformed_lines(read_stats)
+            for path, _ in outputs:
+                if render_cache is not None:
+                    try:
+                        render_cache.put(keys[path], path)
+                    except OSError as e:
+                        click.echo(f"Warning: could not cache the animation: {e}", err=True)
+                click.echo(f"Rendering ended, SVG animation is {path}")
+
+    @main.command("render-batch")
+    @click.argument("inputs", nargs=-1, required=True)
+    @click.option("-o", "--output-dir", help="Directory of the animations (default: next to each cast)")
+    @click.option("-D", "--loop-delay", type=int, help="Delay between animation loops (ms)")
+    @click.option("-m", "--min-duration", type=int, help="Minimum frame duration (ms)")
+    @click.option("-M", "--max-duration", type=int, help="Maximum frame duration (ms)")
+    @click.option("-t", "--template", help="SVG template to use")
+    @click.option(
+        "-j", "--jobs", type=click.IntRange(min=1), default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    @click.option(
+        "--row-lifetimes", is_flag=True,
+        help="Show each row only while it is on screen instead of scrolling through stacked frames",
+    )
+    @click.option(
+        "--max-fps", type=click.FloatRange(min=0, min_open=True),
+        help="Maximum number of frames per second",
+    )
+    @click.option(
+        "--max-frames", type=click.IntRange(min=1),
+        help="Maximum number of frames, merging the least noticeable ones",
+    )
+    @click.option("-z", "--compress", is_flag=True, help="Write gzip compressed SVG (.svgz)")
+    @click.option(
+        "--compact", is_flag=True,
+        help="Use generated CSS classes, short ids and inlined definitions for smaller animations",
+    )
+    @click.option("--no-cache", is_flag=True, help="Render even if the animation is in the cache")
+    def render_batch_command(inputs, output_dir, loop_delay, min_duration, max_duration, template, jobs,
+                             row_lifetimes, max_fps, max_frames, compress, compact, no_cache):
+        """Render many casts (files, directories or glob patterns) to SVG animations"""
+        defaults = get_default_settings()
+
+        if template is None:
+            template = defaults["template"]
+        if theme.load_template(template) is None:
+            click.echo(f"Error: Template '{template}' not found", err=True)
+            sys.exit(1)
+
+        cast_paths = expand_inputs(inputs)
+        if not cast_paths:
+            click.echo("Error: No cast matches the inputs", err=True)
+            sys.exit(1)
+
+        batch_jobs = []
+        for cast_path in cast_paths:
+            output_path = _cast_name(Path(cast_path)).with_suffix(".svgz" if compress else ".svg")
+            if output_dir is not None:
+                output_path = Path(output_dir) / output_path.name
+            batch_jobs.append(BatchJob(cast_path, str(output_path)))
+        duplicates = {job.output_path for job in batch_jobs if
+                      sum(other.output_path == job.output_path for other in batch_jobs) > 1}
+        if duplicates:
+            click.echo(f"Error: Several casts would be rendered to {', '.join(sorted(duplicates))}", err=True)
+            sys.exit(1)
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+        options = {
+            "min_frame_dur": min_duration if min_duration is not None else defaults["min_duration"],
+            "max_frame_dur": max_duration if max_duration is not None else defaults["max_duration"],
+            "loop_delay": loop_delay if loop_delay is not None else defaults["loop_delay"],
+            "row_lifetimes": row_lifetimes,
+            "max_fps": max_fps,
+            "max_frames": max_frames,
+            "compress": compress,
+            "compact": compact,
+        }
+
+        console = Console()
+        failures = 0
+        with console.status(f"正在渲染 {len(batch_jobs)} 个录制...", spinner="dots"):
+            for result in render_batch(batch_jobs, template, options, min(jobs, len(batch_jobs)),
+                                       use_cache=not no_cache):
+                job = result.job
+                if result.error is not None:
+                    failures += 1
+                    console.print(f"✗ {job.cast_path}: {result.error}", markup=False)
+                elif result.cached:
+                    console.print(f"✓ {job.cast_path} → {job.output_path}（缓存）", markup=False)
+                else:
+                    console.print(
+                        f"✓ {job.cast_path} → {job.output_path}（{result.summary.frames} 帧）", markup=False
+                    )
+
+        click.echo(f"Rendered {len(batch_jobs) - failures} of {len(batch_jobs)} casts")
+        if failures:
+            sys.exit(1)
@@ -15,16 +15,23 @@ class ConfigManager:
         self.config_file = get_config_file()
         self.templates_dir = get_templates_dir()
         self._config = None
-        self._bootstrap_templates()
+        # Available templates and the key they were discovered with, see
+        # get_available_templates()
+        self._templates = None
+        self._templates_key = None
+        # Template contents by name: (path, mtime, size) and content
+        self._template_contents = {}
         
     def load_config(self) -> Dict[str, Any]:
-        """Load configuration from config.toml"""
+        """Load configuration from config.toml
+
+        Defaults are used without writing them if the file is missing or
+        corrupted, config.toml is only written by save_config().
+        """
         if self._config is not None:
             return self._config
             
         if not self.config_file.exists():
-            # Create default config file
-            self.save_config(DEFAULT_CONFIG)
             import copy
             self._config = copy.deepcopy(DEFAULT_CONFIG)
         else:
@@ -34,16 +41,21 @@ class ConfigManager:
                 # Merge with defaults for missing keys
                 self._config = self._merge_with_defaults(self._config)
             except Exception as e:
-                # If config file is corrupted, recreate it
-                print(f"Warning: Config file corrupted, recreating: {e}")
-                self.save_config(DEFAULT_CONFIG)
+                print(f"Warning: Config file corrupted, using defaults: {e}")
                 import copy
                 self._config = copy.deepcopy(DEFAULT_CONFIG)
                 
         return self._config
     
     def save_config(self, config: Dict[str, Any]):
-        """Save configuration to config.toml"""
+        """Save configuration to config.toml
+
+        Copies of the builtin templates are written to the templates
+        directory along with the first configuration file, as a starting
+        point for custom templates.
+        """
+        if not self.config_file.exists():
+            self._bootstrap_templates()
         self.config_file.parent.mkdir(parents=True, exist_ok=True)
         with open(self.config_file, 'w', encoding='utf-8') as f:
             toml.dump(config, f)
@@ -74,10 +86,25 @@ class ConfigManager:
         return merged
         
     def get_available_templates(self) -> Dict[str, Optional[Path]]:
-        """Get all available templates (builtin + custom)"""
-        templates = {}
-        
+        """Get all available templates (builtin + custom)
+
+        Templates are discovered again only when the template settings or the
+        modification time of the templates directory change.
+        """
         config = self.load_config()
+        template_settings = config.get("templates", {})
+        key = (
+            template_settings.get("builtin_templates_enabled", True),
+            template_settings.get("custom_templates_enabled", True),
+            self._modification_time(self.templates_dir),
+        )
+        if self._templates_key != key:
+            self._templates = self._discover_templates(config)
+            self._templates_key = key
+        return dict(self._templates)
+
+    def _discover_templates(self, config: Dict[str, Any]) -> Dict[str, Optional[Path]]:
+        templates = {}
         if config.get("templates", {}).get("builtin_templates_enabled", True):
             for name in DEFAULT_TEMPLATES_NAMES:
                 template_name = name.replace('.svg', '')
@@ -95,15 +122,39 @@ class ConfigManager:
         return templates
 
     def get_template_content(self, name: str) -> Optional[bytes]:
-        """Get the content of a template by name"""
+        """Get the content of a template by name
+
+        Contents are cached, custom templates are read again when their
+        modification time or size change.
+        """
         templates = self.get_available_templates()
         if name not in templates:
             return None
             
         path = templates[name]
         if path:
-            return path.read_bytes()
-        return self._get_builtin_template_content(name)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                return None
+            key = (path, stat.st_mtime_ns, stat.st_size)
+        else:
+            key = None
+        cached = self._template_contents.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        content = path.read_bytes() if path else self._get_builtin_template_content(name)
+        if content is not None:
+            self._template_contents[name] = (key, content)
+        return content
+
+    @staticmethod
+    def _modification_time(path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
 
     def _get_builtin_template_content(self, name: str) -> Optional[bytes]:
         filename = f"{name}.svg"
@@ -141,15 +192,17 @@ class ConfigManager:
         if not template_path.exists():
             raise FileNotFoundError(f"Template file not found: {template_path}")
             
-        self.templates_dir.mkdir(parents=True, exist_ok=True)
+        self._bootstrap_templates()
         dest_path = self.templates_dir / f"{name}.svg"
         shutil.copy2(template_path, dest_path)
+        self._templates_key = None
         
     def remove_custom_template(self, name: str):
         """Remove a custom template"""
         template_path = self.templates_dir / f"{name}.svg"
         if template_path.exists():
             template_path.unlink()
+            self._templates_key = None
         else:
             raise FileNotFoundError(f"Custom template not found: {name}")
             
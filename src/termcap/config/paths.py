@@ -1,4 +1,8 @@
-"""Configuration directory management using platformdirs"""
+"""Configuration directory management using platformdirs
+
+Directories are not created here but by the code writing to them, so that
+reading the configuration never writes to the filesystem.
+"""
 from pathlib import Path
 import platformdirs
 
@@ -8,21 +12,15 @@ APP_AUTHOR = "rexwzh"
 
 def get_config_dir() -> Path:
     """Get configuration directory path"""
-    path = Path(platformdirs.user_config_dir(APP_NAME, APP_AUTHOR))
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+    return Path(platformdirs.user_config_dir(APP_NAME, APP_AUTHOR))
 
 def get_data_dir() -> Path:
     """Get data directory path"""
-    path = Path(platformdirs.user_data_dir(APP_NAME, APP_AUTHOR))
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+    return Path(platformdirs.user_data_dir(APP_NAME, APP_AUTHOR))
 
 def get_templates_dir() -> Path:
     """Get templates directory path"""
-    path = get_config_dir() / "templates"
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+    return get_config_dir() / "templates"
 
 def get_config_file() -> Path:
     """Get config file path"""
@@ -1,3 +1,5 @@
-from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header, read_records
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header, ReadStats
+from termcap.parser.formats import read_event_store, read_records
+from termcap.parser.store import EventStore
 
-__all__ = ["AsciiCastV2Header", "AsciiCastV2Event", "read_records"]
+__all__ = ["AsciiCastV2Header", "AsciiCastV2Event", "EventStore", "ReadStats", "read_event_store", "read_records"]
@@ -1,7 +1,27 @@
 """Asciicast V2 parser and data structures"""
 import json
 import codecs
-from typing import NamedTuple, Optional, Union, Iterator, List, Dict, Any
+import gzip
+import hashlib
+import io
+import lzma
+import mmap
+import os
+from typing import NamedTuple, Optional, Union, Iterator, List, Dict, Any, BinaryIO, TextIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Events are decoded by batches of lines spanning about this many bytes
+_BATCH_SIZE = 1 << 22
+# Number of bytes before an offset compared to detect files that were
+# rewritten rather than appended to
+_TAIL_SIZE = 4096
+# First bytes and extensions of compressed casts
+_COMPRESSED_MAGIC = {b'\x1f\x8b': gzip, b'\xfd7zXZ\x00': lzma}
+COMPRESSED_SUFFIXES = {'.gz': gzip, '.xz': lzma}
 
 class AsciiCastV2Header(NamedTuple):
     """Asciicast V2 Header"""
@@ -48,47 +68,255 @@ class AsciiCastV2Event(NamedTuple):
     def to_json_line(self) -> str:
         return json.dumps([self.time, self.event_type, self.event_data])
 
-def read_records(filename: str) -> Iterator[Union[AsciiCastV2Header, AsciiCastV2Event]]:
-    """Read asciicast records from a file"""
-    with open(filename, 'r', encoding='utf-8') as f:
+class ReadStats:
+    """Counters filled by read_records()"""
+    def __init__(self):
+        self.events = 0
+        self.malformed_lines = 0
+        # Line numbers of the first malformed lines, starting from 1 for the header
+        self.malformed_line_numbers: List[int] = []
+
+    def add_malformed(self, line_number: int):
+        self.malformed_lines += 1
+        if len(self.malformed_line_numbers) < 10:
+            self.malformed_line_numbers.append(line_number)
+
+def read_records(filename: str, stats: ReadStats = None) -> Iterator[Union[AsciiCastV2Header, AsciiCastV2Event]]:
+    """Read asciicast records from a file
+
+    The file is memory-mapped and events are decoded by batches of lines
+    as a single JSON array, with orjson if it is installed
+    (``pip install termcap[json]``). Blank lines are
+    skipped, malformed lines are skipped and counted in ``stats``.
+    Gzip or xz compressed casts are decompressed as they are read.
+    """
+    if stats is None:
+        stats = ReadStats()
+    with open_cast(filename) as f:
         # Read header
-        line = f.readline()
-        if not line:
+        header_line = f.readline()
+        if not header_line:
             raise ValueError("Empty file")
         
+        yield parse_header(header_line)
+        
+        line_number = 2
+        for batch in _batches(f):
+            # Read events
+            events = _parse_batch(batch, line_number, stats)
+            stats.events += len(events)
+            line_number += batch.count(b'\n')
+            yield from events
+
+def open_cast(filename: str) -> BinaryIO:
+    """Open a cast for reading in binary mode
+
+    Casts compressed with gzip or xz, recognized by their first bytes, are
+    decompressed as they are read.
+    """
+    f = open(filename, 'rb')
+    magic = f.read(max(len(prefix) for prefix in _COMPRESSED_MAGIC))
+    for prefix, module in _COMPRESSED_MAGIC.items():
+        if magic[:len(prefix)] == prefix:
+            f.close()
+            return module.open(filename, 'rb')
+    f.seek(0)
+    return f
+
+def open_cast_output(filename: str) -> TextIO:
+    """Open a cast for writing text
+
+    Casts whose name ends in .gz or .xz are compressed as they are written,
+    so only a few blocks of them are ever kept uncompressed in memory.
+    """
+    for suffix, module in COMPRESSED_SUFFIXES.items():
+        if filename.endswith(suffix):
+            return module.open(filename, 'wt', encoding='utf-8')
+    return open(filename, 'w', encoding='utf-8')
+
+def _batches(f):
+    """Generate the rest of f by batches of whole lines
+
+    Regular files are memory-mapped, other files such as pipes and
+    decompressed streams are read a batch at a time.
+    """
+    if isinstance(f, io.BufferedReader):
         try:
-            header_data = json.loads(line)
-        except json.JSONDecodeError:
-            raise ValueError("Invalid header JSON")
-            
-        if 'version' not in header_data or header_data['version'] != 2:
-            raise ValueError("Unsupported asciicast version")
-            
-        yield AsciiCastV2Header(
-            version=header_data.get('version'),
-            width=header_data.get('width'),
-            height=header_data.get('height'),
-            timestamp=header_data.get('timestamp'),
-            duration=header_data.get('duration'),
-            idle_time_limit=header_data.get('idle_time_limit'),
-            command=header_data.get('command'),
-            title=header_data.get('title'),
-            env=header_data.get('env'),
-            theme=header_data.get('theme')
-        )
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            data = None
+        if data is not None:
+            try:
+                start = f.tell()
+                while start < len(data):
+                    end = data.find(b'\n', min(start + _BATCH_SIZE, len(data)) - 1)
+                    end = len(data) if end == -1 else end + 1
+                    yield data[start:end]
+                    start = end
+            finally:
+                data.close()
+            return
+
+    # Decompressed streams return what they decoded before an error with read1
+    read = getattr(f, 'read1', f.read)
+    rest = b''
+    end_of_file = truncated = False
+    while not end_of_file:
+        parts = [rest]
+        size = len(rest)
+        while size < _BATCH_SIZE:
+            try:
+                data = read(_BATCH_SIZE - size)
+            except EOFError:
+                # Truncated compressed cast, such as one still being recorded
+                data = None
+                truncated = True
+            if not data:
+                end_of_file = True
+                break
+            parts.append(data)
+            size += len(data)
+        data = b''.join(parts)
+        end = data.rfind(b'\n') + 1
+        if end:
+            yield data[:end]
+        rest = data[end:]
+    # The last line of a truncated cast is incomplete
+    if rest and not truncated:
+        yield rest
+
+def _parse_batch(batch: bytes, first_line_number: int, stats: ReadStats) -> List[AsciiCastV2Event]:
+    """Parse consecutive lines of events, one line at a time only if some are malformed"""
+    try:
+        rows = _loads(b'[' + batch.rstrip().replace(b'\n', b',') + b']')
+    except ValueError:
+        rows = None
+    # A line holding several events is malformed, so each line must be a row
+    line_count = batch.count(b'\n') + (not batch.endswith(b'\n'))
+    if (
+        rows is not None
+        and len(rows) == line_count
+        and all(type(row) is list and len(row) == 3 for row in rows)
+    ):
+        return [_new_event(AsciiCastV2Event, row + [None]) for row in rows]
+
+    events = []
+    for line_number, line in enumerate(batch.split(b'\n'), first_line_number):
+        if not line.strip():
+            continue
+        event = _parse_event(line)
+        if event is None:
+            stats.add_malformed(line_number)
+        else:
+            events.append(event)
+    return events
+
+# Build events from lists of their four fields without the overhead of the
+# keyword arguments of NamedTuple.__new__
+_new_event = tuple.__new__
+
+def _loads(data: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects some documents json accepts, such as lone surrogates
+            pass
+    return json.loads(data)
+
+def parse_header(line: Union[str, bytes]) -> AsciiCastV2Header:
+    """Parse the header line of an asciicast v2 file"""
+    try:
+        header_data = json.loads(line)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid header JSON")
         
-        # Read events
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+    if 'version' not in header_data or header_data['version'] != 2:
+        raise ValueError("Unsupported asciicast version")
+        
+    return AsciiCastV2Header(
+        version=header_data.get('version'),
+        width=header_data.get('width'),
+        height=header_data.get('height'),
+        timestamp=header_data.get('timestamp'),
+        duration=header_data.get('duration'),
+        idle_time_limit=header_data.get('idle_time_limit'),
+        command=header_data.get('command'),
+        title=header_data.get('title'),
+        env=header_data.get('env'),
+        theme=header_data.get('theme')
+    )
+
+def _parse_event(line: Union[str, bytes]) -> Optional[AsciiCastV2Event]:
+    """Parse an event line, return None for blank or invalid lines"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        event_data = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(event_data, list) and len(event_data) >= 3:
+        return AsciiCastV2Event(
+            time=event_data[0],
+            event_type=event_data[1],
+            event_data=event_data[2]
+        )
+    return None
+
+class EventReader:
+    """Iterate over the events of an asciicast file from a byte offset
+
+    ``offset`` is the position following the last line read. A last line
+    without a newline, such as a line still being written to a growing
+    file, is left unread. Offsets of compressed casts are positions in the
+    decompressed content.
+    """
+    def __init__(self, filename: str, offset: int = None):
+        self.filename = filename
+        with open_cast(filename) as f:
+            self.header_line = f.readline()
+            if not self.header_line:
+                raise ValueError("Empty file")
+            self.header = parse_header(self.header_line)
+            self.offset = f.tell() if offset is None else offset
+
+    def __iter__(self) -> Iterator[AsciiCastV2Event]:
+        with open_cast(self.filename) as f:
+            f.seek(self.offset)
             try:
-                event_data = json.loads(line)
-                if len(event_data) >= 3:
-                    yield AsciiCastV2Event(
-                        time=event_data[0],
-                        event_type=event_data[1],
-                        event_data=event_data[2]
-                    )
-            except json.JSONDecodeError:
-                continue
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self.offset += len(line)
+                    event = _parse_event(line)
+                    if event is not None:
+                        yield event
+            except EOFError:
+                # Truncated compressed cast
+                pass
+
+    def end(self) -> int:
+        """Return the offset at the end of the file"""
+        with open_cast(self.filename) as f:
+            if isinstance(f, io.BufferedReader):
+                return os.path.getsize(self.filename)
+            # The size of compressed casts is only known once decompressed
+            try:
+                while f.read(_BATCH_SIZE):
+                    pass
+            except EOFError:
+                pass
+            return f.tell()
+
+    def tail_digest(self, offset: int) -> bytes:
+        """Return a digest of the last 4 KiB of the file preceding offset
+
+        Comparing digests taken at the same offset tells a file that was only
+        appended to from most rewritten ones. This is a heuristic: a file
+        rewritten with the same 4 KiB before offset is taken as appended to.
+        """
+        with open_cast(self.filename) as f:
+            start = max(0, offset - _TAIL_SIZE)
+            f.seek(start)
+            return hashlib.sha256(f.read(offset - start)).digest()
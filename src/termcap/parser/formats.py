@@ -0,0 +1,55 @@
+"""Reading of casts in any of the supported formats
+
+Casts are asciicast v2 files, possibly compressed with gzip or xz, or .tcap
+files (see termcap.parser.tcap). The format is detected from the first bytes
+of the file.
+"""
+from typing import Iterator, Tuple, Union
+
+from termcap.parser import tcap
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header, EventReader, ReadStats, open_cast
+from termcap.parser.asciicast import read_records as read_asciicast_records
+from termcap.parser.store import EventStore
+
+def is_tcap(filename: str) -> bool:
+    """Return True if the cast at filename is a .tcap file
+
+    Raise ValueError for a compressed .tcap file: its chunks are compressed
+    already and it could only be read by decompressing it whole.
+    """
+    with open_cast(filename) as f:
+        if f.read(len(tcap.MAGIC)) != tcap.MAGIC:
+            return False
+    if not tcap.is_tcap(filename):
+        raise ValueError("Compressed .tcap files are not supported")
+    return True
+
+def read_records(filename: str, stats: ReadStats = None) -> Iterator[Union[AsciiCastV2Header, AsciiCastV2Event]]:
+    """Read the header then the events of a cast, see asciicast.read_records()"""
+    if not is_tcap(filename):
+        yield from read_asciicast_records(filename, stats)
+        return
+    if stats is None:
+        stats = ReadStats()
+    reader = tcap.TcapReader(filename)
+    yield reader.header
+    for number in range(len(reader.chunks)):
+        events = reader.read_chunk(number)
+        stats.events += len(events)
+        yield from events
+
+def open_event_reader(filename: str, offset: int = None) -> Union[EventReader, tcap.TcapEventReader]:
+    """Return an EventReader of a cast, or a TcapEventReader of a .tcap file"""
+    if is_tcap(filename):
+        return tcap.TcapEventReader(filename, offset)
+    return EventReader(filename, offset)
+
+def read_event_store(filename: str, stats: ReadStats = None) -> Tuple[AsciiCastV2Header, EventStore]:
+    """Read the header and the events of a cast into an EventStore
+
+    The whole cast is held in memory, read_records() reads it one event at a
+    time.
+    """
+    records = read_records(filename, stats)
+    header = next(records)
+    return header, EventStore.from_events(records)
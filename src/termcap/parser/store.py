@@ -0,0 +1,181 @@
+"""Columnar storage of asciicast events
+
+An EventStore keeps the events of a cast in a few flat arrays instead of one
+AsciiCastV2Event per event: the times as doubles, the event types as one byte
+codes, and the data of every event in a single UTF-8 buffer delimited by an
+array of offsets. This takes a fraction of the memory of the equivalent list
+of events, and ranges of events can be sliced and searched by time without
+copying them.
+
+Stores are meant for library users that keep the events of a cast in memory.
+The render and replay commands stream the events of a cast instead, which
+holds fewer of them at any time than a store of the whole cast.
+"""
+import bisect
+import itertools
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from termcap.parser.asciicast import AsciiCastV2Event
+
+# Lone surrogates are valid in JSON strings but not in UTF-8
+_ERRORS = 'surrogatepass'
+_CHUNK_SIZE = 1 << 16
+_new_event = tuple.__new__
+
+class EventStore:
+    """Immutable sequence of events stored column by column
+
+    Indexing returns AsciiCastV2Event objects and iterating over a store
+    yields them, so a store can replace a list of events. Slicing returns a
+    store sharing the columns of the original one.
+    """
+    def __init__(self, times: array, types: array, type_names: List[str], offsets: array,
+                 text: bytearray, start: int = 0, stop: int = None):
+        self._times = times
+        self._types = types
+        self._type_names = type_names
+        self._type_codes = {name: code for code, name in enumerate(type_names)}
+        self._offsets = offsets
+        self._text = text
+        # The store is immutable, views of the text can be shared
+        self._text_view = memoryview(text)
+        self._start = start
+        self._stop = len(times) if stop is None else stop
+
+    @classmethod
+    def from_events(cls, events: Iterable[AsciiCastV2Event]) -> 'EventStore':
+        times = array('d')
+        types = array('B')
+        offsets = array('Q', [0])
+        text = bytearray()
+        type_codes = {}
+        events = iter(events)
+        # Columns are extended a chunk of events at a time
+        while True:
+            chunk = list(itertools.islice(events, _CHUNK_SIZE))
+            if not chunk:
+                break
+            for event in chunk:
+                if event.event_type not in type_codes:
+                    type_codes[event.event_type] = len(type_codes)
+            times.extend([event.time for event in chunk])
+            types.extend([type_codes[event.event_type] for event in chunk])
+            encoded = [event.event_data.encode('utf-8', _ERRORS) for event in chunk]
+            ends = itertools.accumulate(map(len, encoded), initial=len(text))
+            offsets.extend(itertools.islice(ends, 1, None))
+            text += b''.join(encoded)
+        return cls(times, types, list(type_codes), offsets, text)
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[AsciiCastV2Event, 'EventStore']:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('EventStore slices do not support steps')
+            return EventStore(
+                self._times, self._types, self._type_names, self._offsets, self._text,
+                self._start + start, self._start + max(start, stop)
+            )
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('EventStore index out of range')
+        return AsciiCastV2Event(self.time(key), self.event_type(key), self.data(key))
+
+    def __iter__(self) -> Iterator[AsciiCastV2Event]:
+        # Events are built a chunk at a time, decoding the text of the chunk
+        # at once if it is ASCII
+        for start in range(self._start, self._stop, _CHUNK_SIZE):
+            stop = min(start + _CHUNK_SIZE, self._stop)
+            ends = self._offsets[start:stop + 1].tolist()
+            text = bytes(self._text_view[ends[0]:ends[-1]])
+            if ends[0]:
+                ends = [end - ends[0] for end in ends]
+            if text.isascii():
+                text = text.decode('ascii')
+                data = [text[begin:end] for begin, end in zip(ends, ends[1:])]
+            else:
+                data = [text[begin:end].decode('utf-8', _ERRORS) for begin, end in zip(ends, ends[1:])]
+            names = [self._type_names[code] for code in self._types[start:stop]]
+            for event in zip(self._times[start:stop], names, data, itertools.repeat(None)):
+                yield _new_event(AsciiCastV2Event, event)
+
+    @property
+    def times(self) -> memoryview:
+        """Times of the events"""
+        return memoryview(self._times)[self._start:self._stop]
+
+    @property
+    def types(self) -> memoryview:
+        """Type codes of the events, see type_code()"""
+        return memoryview(self._types)[self._start:self._stop]
+
+    def type_code(self, event_type: str) -> Optional[int]:
+        """Return the code of an event type, or None if no event has that type"""
+        return self._type_codes.get(event_type)
+
+    def time(self, index: int) -> float:
+        return self._times[self._start + index]
+
+    def event_type(self, index: int) -> str:
+        return self._type_names[self._types[self._start + index]]
+
+    def data(self, index: int) -> str:
+        return str(self.data_view(index), 'utf-8', _ERRORS)
+
+    def data_view(self, index: int) -> memoryview:
+        """Return the UTF-8 encoded data of an event without copying it"""
+        index += self._start
+        return self._text_view[self._offsets[index]:self._offsets[index + 1]]
+
+    def bisect(self, time: float, right: bool = False) -> int:
+        """Return the index of the first event at or after time, or after time if right is true"""
+        search = bisect.bisect_right if right else bisect.bisect_left
+        return search(self._times, time, self._start, self._stop) - self._start
+
+    def joined_data(self, start: int, stop: int, event_type: str = 'o') -> str:
+        """Return the data of the events of a type from start to stop, concatenated"""
+        code = self._type_codes.get(event_type)
+        start, stop = self._start + start, self._start + stop
+        if code is None or start >= stop:
+            return ''
+        text, offsets = self._text_view, self._offsets
+        if len(self._type_names) == 1 or self._types[start:stop].count(code) == stop - start:
+            # The data of consecutive events is contiguous
+            return str(text[offsets[start]:offsets[stop]], 'utf-8', _ERRORS)
+        return ''.join(
+            str(text[offsets[index]:offsets[index + 1]], 'utf-8', _ERRORS)
+            for index in range(start, stop) if self._types[index] == code
+        )
+
+    def columns(self) -> Tuple[array, array, List[str], array, bytes]:
+        """Return copies of the columns of the store
+
+        These are the times, the type codes, the type names, the end offsets
+        of the data of each event and the data, all relative to the first
+        event of the store.
+        """
+        start, stop = self._start, self._stop
+        base = self._offsets[start]
+        ends = array('Q', (offset - base for offset in self._offsets[start + 1:stop + 1]))
+        return (
+            self._times[start:stop], self._types[start:stop], list(self._type_names),
+            ends, bytes(self._text_view[base:self._offsets[stop]])
+        )
+
+    @classmethod
+    def from_columns(cls, times: array, types: array, type_names: List[str], ends: array,
+                     text: bytes) -> 'EventStore':
+        """Return the store of columns as returned by columns()"""
+        offsets = array('Q', [0])
+        offsets.extend(ends)
+        return cls(times, types, type_names, offsets, bytearray(text))
+
+    def nbytes(self) -> int:
+        """Return the size of the columns of the whole store in bytes"""
+        return sum(
+            column.itemsize * len(column) for column in (self._times, self._types, self._offsets)
+        ) + len(self._text)
@@ -0,0 +1,236 @@
+"""Indexed binary container of asciicast recordings (.tcap)
+
+A .tcap file holds the header of a cast followed by blocks of events, each
+compressed on its own, and an index of the blocks at the end of the file::
+
+    magic "TCAP", version (u8), codec (u8), header length (u32), header JSON
+    chunk 1 .. chunk N
+    index: N entries of first time (f64), last time (f64), offset (u64),
+           size (u32), number of events (u32)
+    trailer: index offset (u64), N (u32), magic "TCAP"
+
+Integers and floats are little-endian. A chunk is the compressed
+serialization of an EventStore: the number of events (u32), the length of
+the JSON list of type names (u32) and that list, then the times (f64), type
+codes (u8), end offsets of the data of each event (u64) and the UTF-8 data
+of the events.
+
+The index gives the time range and the number of events of every chunk, so
+a reader can skip to any time or event of a recording and decode only the
+chunks it needs.
+"""
+import bisect
+import hashlib
+import itertools
+import json
+import lzma
+import struct
+import sys
+import zlib
+from array import array
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple
+
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header, parse_header
+from termcap.parser.store import EventStore
+
+MAGIC = b'TCAP'
+VERSION = 1
+CODECS = ('none', 'zlib', 'lzma')
+# A chunk is closed once it holds this many events or bytes of event data
+CHUNK_EVENTS = 1 << 14
+CHUNK_BYTES = 1 << 20
+
+_PREAMBLE = struct.Struct('<4sBBI')
+_INDEX_ENTRY = struct.Struct('<ddQII')
+_TRAILER = struct.Struct('<QI4s')
+_CHUNK_HEADER = struct.Struct('<II')
+
+class ChunkInfo(NamedTuple):
+    first_time: float
+    last_time: float
+    offset: int
+    size: int
+    events: int
+
+def is_tcap(path: str) -> bool:
+    """Return True if the file at path starts like a .tcap file"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write_tcap(path: str, header_line: bytes, events: Iterable[AsciiCastV2Event],
+               codec: str = 'zlib') -> int:
+    """Write a header line and events to a .tcap file, return the number of events"""
+    if codec not in CODECS:
+        raise ValueError(f'Unknown codec: {codec}')
+    header_line = header_line.strip()
+    parse_header(header_line)
+
+    index = []
+    with open(path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, CODECS.index(codec), len(header_line)))
+        f.write(header_line)
+        for chunk in _chunks(events):
+            store = EventStore.from_events(chunk)
+            data = _compress(codec, _serialize(store))
+            index.append(ChunkInfo(chunk[0].time, chunk[-1].time, f.tell(), len(data), len(chunk)))
+            f.write(data)
+
+        index_offset = f.tell()
+        for entry in index:
+            f.write(_INDEX_ENTRY.pack(*entry))
+        f.write(_TRAILER.pack(index_offset, len(index), MAGIC))
+    return sum(entry.events for entry in index)
+
+class TcapReader:
+    """Random access to the events of a .tcap file"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, codec, header_size = _PREAMBLE.unpack(_read_exactly(f, _PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('Not a .tcap file')
+            if version != VERSION:
+                raise ValueError(f'Unsupported .tcap version: {version}')
+            if codec >= len(CODECS):
+                raise ValueError(f'Unknown .tcap codec: {codec}')
+            self.codec = CODECS[codec]
+            self.header_line = _read_exactly(f, header_size)
+            self.header: AsciiCastV2Header = parse_header(self.header_line)
+
+            f.seek(-_TRAILER.size, 2)
+            index_offset, chunk_count, end_magic = _TRAILER.unpack(_read_exactly(f, _TRAILER.size))
+            if end_magic != MAGIC:
+                raise ValueError('Truncated .tcap file')
+            f.seek(index_offset)
+            self.index_bytes = _read_exactly(f, chunk_count * _INDEX_ENTRY.size)
+
+        self.chunks: List[ChunkInfo] = [
+            ChunkInfo(*entry) for entry in _INDEX_ENTRY.iter_unpack(self.index_bytes)
+        ]
+        # Number of events before each chunk
+        self.chunk_starts = list(itertools.accumulate(
+            (chunk.events for chunk in self.chunks), initial=0
+        ))
+        self.chunk_last_times = [chunk.last_time for chunk in self.chunks]
+
+    def __len__(self) -> int:
+        return self.chunk_starts[-1]
+
+    def read_chunk(self, number: int) -> EventStore:
+        chunk = self.chunks[number]
+        with open(self.path, 'rb') as f:
+            f.seek(chunk.offset)
+            return _deserialize(_decompress(self.codec, _read_exactly(f, chunk.size)))
+
+    def chunk_at_event(self, position: int) -> int:
+        """Return the number of the chunk holding the event at position"""
+        return bisect.bisect_right(self.chunk_starts, position) - 1
+
+    def chunk_at_time(self, time: float) -> int:
+        """Return the number of the first chunk holding events at or after time"""
+        return bisect.bisect_left(self.chunk_last_times, time)
+
+    def events(self, position: int = 0) -> Iterator[AsciiCastV2Event]:
+        """Generate the events from the one at position"""
+        for number in range(self.chunk_at_event(position), len(self.chunks)):
+            store = self.read_chunk(number)
+            yield from store[max(0, position - self.chunk_starts[number]):]
+
+    def events_between(self, start: float, end: float = None) -> Iterator[AsciiCastV2Event]:
+        """Generate the events from start to end, decoding only the chunks holding them"""
+        for number in range(self.chunk_at_time(start), len(self.chunks)):
+            if end is not None and self.chunks[number].first_time > end:
+                break
+            store = self.read_chunk(number)
+            stop = len(store) if end is None else store.bisect(end, right=True)
+            yield from store[store.bisect(start):stop]
+
+class TcapEventReader:
+    """EventReader of a .tcap file, whose offsets are numbers of events"""
+    def __init__(self, filename: str, offset: int = None):
+        self.filename = filename
+        self._reader = TcapReader(filename)
+        self.header_line = self._reader.header_line
+        self.header = self._reader.header
+        self.offset = 0 if offset is None else offset
+
+    def __iter__(self) -> Iterator[AsciiCastV2Event]:
+        for event in self._reader.events(self.offset):
+            self.offset += 1
+            yield event
+
+    def end(self) -> int:
+        """Return the number of events of the file"""
+        return len(self._reader)
+
+    def tail_digest(self, offset: int) -> bytes:
+        """Return a digest of the index of the file
+
+        .tcap files are written at once, their index identifies them.
+        """
+        return hashlib.sha256(self._reader.index_bytes).digest()
+
+def _chunks(events):
+    chunk = []
+    size = 0
+    for event in events:
+        chunk.append(event)
+        # Data is stored as UTF-8, encoded as EventStore does
+        size += len(event.event_data.encode('utf-8', 'surrogatepass'))
+        if len(chunk) >= CHUNK_EVENTS or size >= CHUNK_BYTES:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+def _serialize(store: EventStore) -> bytes:
+    times, types, type_names, ends, text = store.columns()
+    names = json.dumps(type_names).encode()
+    return b''.join([
+        _CHUNK_HEADER.pack(len(times), len(names)), names,
+        _little_endian(times), types.tobytes(), _little_endian(ends), text
+    ])
+
+def _deserialize(data: bytes) -> EventStore:
+    count, names_size = _CHUNK_HEADER.unpack_from(data)
+    position = _CHUNK_HEADER.size
+    type_names = json.loads(data[position:position + names_size])
+    position += names_size
+
+    columns = []
+    for typecode, itemsize in (('d', 8), ('B', 1), ('Q', 8)):
+        column = array(typecode)
+        column.frombytes(data[position:position + count * itemsize])
+        if sys.byteorder == 'big' and itemsize > 1:
+            column.byteswap()
+        columns.append(column)
+        position += count * itemsize
+    times, types, ends = columns
+    return EventStore.from_columns(times, types, type_names, ends, data[position:])
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def _compress(codec, data):
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    if codec == 'lzma':
+        return lzma.compress(data)
+    return data
+
+def _decompress(codec, data):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    return data
+
+def _read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated .tcap file')
+    return data
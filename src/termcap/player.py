@@ -1,8 +1,9 @@
 import sys
 import time
-from typing import Optional
+from typing import Iterable, Optional
 
-from termcap.parser.asciicast import read_records, AsciiCastV2Header, AsciiCastV2Event
+from termcap.parser.asciicast import AsciiCastV2Header, AsciiCastV2Event
+from termcap.parser.formats import read_records
 
 
 def play(filename: str, speed: float = 1.0, idle_time_limit: Optional[float] = None):
@@ -31,13 +32,19 @@ def play(filename: str, speed: float = 1.0, idle_time_limit: Optional[float] = N
         print("Error: Invalid file format (missing header).", file=sys.stderr)
         return
 
+    play_events(records, speed, idle_time_limit)
+
+
+def play_events(events: Iterable[AsciiCastV2Event], speed: float = 1.0,
+                idle_time_limit: Optional[float] = None):
+    """Replay events, such as the records following the header or an EventStore"""
     sys.stdout.write("\x1b[2J\x1b[H")
     sys.stdout.flush()
 
     current_time = 0.0
 
     try:
-        for record in records:
+        for record in events:
             if not isinstance(record, AsciiCastV2Event) or record.event_type != "o":
                 continue
 
@@ -1,4 +1,5 @@
 from termcap.recorder.core import record_session
 from termcap.recorder.terminal import TerminalMode, get_terminal_size
+from termcap.recorder.writer import CastWriter
 
-__all__ = ["record_session", "TerminalMode", "get_terminal_size"]
+__all__ = ["record_session", "TerminalMode", "get_terminal_size", "CastWriter"]
@@ -1,25 +1,71 @@
-"""Core recording logic"""
+"""Core recording logic
+
+The session is driven by a selector (epoll on Linux) watching the input of
+the user, the PTY of the child and the exit of the child. Data read on one
+side is queued until the other side can take it, and a side is not read
+while too much of its data waits, so a slow terminal slows the child down
+instead of losing output.
+"""
 import os
 import pty
-import select
+import selectors
+import signal
 import time
 import fcntl
 import termios
 import struct
 import codecs
-from typing import Iterator, List, Union
+from typing import Callable, Iterator, List, Tuple, Union
 
 from termcap.parser.asciicast import AsciiCastV2Header, AsciiCastV2Event
 
+# Size of the reads of the PTY and of the input
+_READ_SIZE = 1 << 16
+# A side is not read while this many bytes of its data wait to be written
+_MAX_PENDING = 1 << 20
+
+class _OutputQueue:
+    """Bytes waiting to be written to a file descriptor"""
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.data = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def write(self):
+        """Write as much as the file descriptor takes without blocking"""
+        while self.data:
+            try:
+                written = os.write(self.fd, self.data)
+            except (BlockingIOError, InterruptedError):
+                return
+            del self.data[:written]
+
+    def drain(self):
+        """Write everything, waiting for the file descriptor if needed"""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_WRITE)
+            while self.data:
+                selector.select()
+                self.write()
+
 def record_session(
     process_args: List[str],
     columns: int,
     lines: int,
     input_fileno: int,
-    output_fileno: int
+    output_fileno: int,
+    tick: Callable[[], None] = None,
+    tick_interval: float = None
 ) -> Iterator[Union[AsciiCastV2Header, AsciiCastV2Event]]:
-    """Record a terminal session"""
-    
+    """Record a terminal session
+
+    ``tick`` is called after every wait for the terminals, which lasts at
+    most ``tick_interval`` seconds, e.g. to flush recorded events while the
+    session is idle.
+    """
+
     # Yield the header first
     yield AsciiCastV2Header(
         version=2,
@@ -29,70 +75,126 @@ def record_session(
     )
 
     pid, master_fd = pty.fork()
-    
+
     if pid == 0:
         # Child process
         os.execvp(process_args[0], process_args)
-        
+
     # Parent process
     # Set terminal size for the PTY
     winsize = struct.pack("HHHH", lines, columns, 0, 0)
     fcntl.ioctl(master_fd, termios.TIOCSWINSZ, winsize)
-    
+    os.set_blocking(master_fd, False)
+
     # Use incremental decoder to handle multi-byte characters split across chunks
     decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
-    
+    # Reads go to a buffer allocated once
+    buffer = bytearray(_READ_SIZE)
+    view = memoryview(buffer)
+    to_child = _OutputQueue(master_fd)
+    to_user = _OutputQueue(output_fileno)
+    selector = selectors.DefaultSelector()
+    registered = {}
+    exit_fd, stop_watching = _watch_child_exit(pid)
+
     start_time = time.time()
-    
+
+    def read_child():
+        """Read output of the child into buffer, return its size or None if there is none yet"""
+        try:
+            return os.readv(master_fd, [buffer])
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError:
+            # EIO once the child side of the PTY is closed
+            return 0
+
+    def record(size):
+        """Queue output of the child for the user, return the event recording it or None"""
+        to_user.data += view[:size]
+        to_user.write()
+        decoded_data = decoder.decode(view[:size], final=False)
+        if not decoded_data:
+            return None
+        return AsciiCastV2Event(
+            time=time.time() - start_time,
+            event_type="o",
+            event_data=decoded_data
+        )
+
     try:
-        while True:
-            rlist = [input_fileno, master_fd]
-            rfds, _, _ = select.select(rlist, [], [])
-            
-            for fd in rfds:
-                if fd == input_fileno:
+        running = True
+        while running:
+            wanted = {exit_fd: selectors.EVENT_READ}
+            if len(to_child) < _MAX_PENDING:
+                wanted[input_fileno] = selectors.EVENT_READ
+            if len(to_user) < _MAX_PENDING:
+                wanted[master_fd] = selectors.EVENT_READ
+            if to_child:
+                wanted[master_fd] = wanted.get(master_fd, 0) | selectors.EVENT_WRITE
+            if to_user:
+                wanted[output_fileno] = wanted.get(output_fileno, 0) | selectors.EVENT_WRITE
+            _update_selector(selector, registered, wanted)
+
+            ready = selector.select(tick_interval)
+            if tick is not None:
+                tick()
+            for key, mask in ready:
+                fd = key.fd
+                if mask & selectors.EVENT_WRITE:
+                    if fd == master_fd:
+                        to_child.write()
+                    if fd == output_fileno:
+                        to_user.write()
+                if not mask & selectors.EVENT_READ:
+                    continue
+
+                if fd == exit_fd:
+                    # The last output of the child is read below
+                    if _child_exited(pid, exit_fd):
+                        running = False
+                elif fd == input_fileno:
                     # User input -> Child process
                     try:
-                        data = os.read(input_fileno, 1024)
+                        size = os.readv(input_fileno, [buffer])
                     except OSError:
+                        size = 0
+                    if not size:
+                        running = False
                         break
-                        
-                    if not data:
-                        break
-                        
-                    os.write(master_fd, data)
-                    
+                    to_child.data += view[:size]
+                    to_child.write()
                 elif fd == master_fd:
                     # Child output -> User terminal + Recording
-                    try:
-                        data = os.read(master_fd, 1024)
-                    except OSError:
-                        break
-                        
-                    if not data:
+                    size = read_child()
+                    if size is None:
+                        continue
+                    if not size:
+                        running = False
                         break
-                    
-                    # Write to user terminal
-                    os.write(output_fileno, data)
-                    
-                    # Record event
-                    elapsed = time.time() - start_time
-                    decoded_data = decoder.decode(data, final=False)
-                    if decoded_data:
-                        yield AsciiCastV2Event(
-                            time=elapsed,
-                            event_type="o",
-                            event_data=decoded_data
-                        )
-                        
-            # Check if child process is still alive
-            if os.waitpid(pid, os.WNOHANG)[0] == pid:
-                break
-                
+                    event = record(size)
+                    if event:
+                        yield event
+
+        # Output left in the PTY
+        size = read_child()
+        while size:
+            event = record(size)
+            if event:
+                yield event
+            size = read_child()
+        to_user.drain()
     except OSError:
         pass
     finally:
+        selector.close()
+        stop_watching()
         os.close(master_fd)
+        try:
+            # Reap the child if it exited
+            os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            pass
         # Flush decoder
         remaining = decoder.decode(b"", final=True)
         if remaining:
@@ -101,3 +203,64 @@ def record_session(
                 event_type="o",
                 event_data=remaining
             )
+
+def _update_selector(selector: selectors.BaseSelector, registered: dict, wanted: dict):
+    """Watch the events of wanted, a dict of file descriptor to events"""
+    for fd in [fd for fd in registered if fd not in wanted]:
+        selector.unregister(fd)
+        del registered[fd]
+    for fd, events in wanted.items():
+        if fd not in registered:
+            selector.register(fd, events)
+        elif registered[fd] != events:
+            selector.modify(fd, events)
+        registered[fd] = events
+
+def _watch_child_exit(pid: int) -> Tuple[int, Callable[[], None]]:
+    """Return a file descriptor readable once the child may have exited
+
+    This is a pidfd where available, otherwise a pipe written to on
+    SIGCHLD. The function returned stops watching.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pass
+    else:
+        return pidfd, lambda: os.close(pidfd)
+
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+    try:
+        # The wakeup file descriptor is only written to for handled signals
+        previous_handler = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        previous_fd = signal.set_wakeup_fd(write_fd)
+    except ValueError:
+        # Signals are only handled in the main thread, the end of the
+        # session is then detected when the PTY closes
+        previous_handler = None
+    # The child may have exited before the handler was set
+    os.write(write_fd, b"\0")
+
+    def stop():
+        if previous_handler is not None:
+            signal.set_wakeup_fd(previous_fd)
+            signal.signal(signal.SIGCHLD, previous_handler)
+        os.close(read_fd)
+        os.close(write_fd)
+
+    return read_fd, stop
+
+def _child_exited(pid: int, exit_fd: int) -> bool:
+    try:
+        # Empty the pipe of SIGCHLD, which may be for another child
+        while os.read(exit_fd, 512):
+            pass
+    except OSError:
+        # A pidfd cannot be read, and an empty pipe raises BlockingIOError
+        pass
+    try:
+        return os.waitpid(pid, os.WNOHANG)[0] == pid
+    except ChildProcessError:
+        return True
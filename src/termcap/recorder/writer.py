@@ -0,0 +1,107 @@
+"""Buffered writing of recorded sessions
+
+The recorder yields an event for every read of the terminal, which under a
+flood of output such as ``yes`` is tens of thousands of small events per
+second. CastWriter merges events of the same type following each other
+within a short window into one event, writes them as compact JSON with
+timestamps rounded to a fixed precision, and writes the file by large
+blocks, at least every ``flush_interval`` seconds when flush_if_due() is
+called regularly.
+"""
+import json
+import time
+from typing import List, Optional, TextIO
+
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header
+
+DEFAULT_COALESCE_WINDOW = 0.005
+DEFAULT_TIME_PRECISION = 3
+DEFAULT_BUFFER_SIZE = 1 << 20
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_ENCODER = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+class CastWriter:
+    """Write the header and the events of a session to a text file
+
+    Events of the same type less than ``coalesce_window`` seconds after the
+    first event of a pending group are appended to it; a window of 0 writes
+    every event as is. The group takes the time of its first event, so
+    merging moves output earlier by at most the window.
+    """
+    def __init__(self, cast_file: TextIO, coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+                 time_precision: int = DEFAULT_TIME_PRECISION, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.cast_file = cast_file
+        self.coalesce_window = coalesce_window
+        self.time_precision = time_precision
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        # Number of events written, after merging
+        self.events = 0
+        self._pending: Optional[AsciiCastV2Event] = None
+        self._pending_data: List[str] = []
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def write_header(self, header: AsciiCastV2Header):
+        self._buffer.append(header.to_json_line() + '\n')
+
+    def write_event(self, event: AsciiCastV2Event):
+        pending = self._pending
+        if (
+            pending is not None
+            and event.event_type == pending.event_type
+            and event.time - pending.time < self.coalesce_window
+        ):
+            self._pending_data.append(event.event_data)
+            return
+        self._write_pending()
+        self._pending = event
+        self._pending_data = [event.event_data]
+        if self._buffered >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered events to the file, the pending group excepted"""
+        if self._buffer:
+            self.cast_file.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        self.cast_file.flush()
+        self._last_flush = time.monotonic()
+
+    def flush_if_due(self):
+        """Write every event, the pending group included, if the last flush is flush_interval old
+
+        Called while the session is idle, so that recorded events reach the
+        file without waiting for more output.
+        """
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._write_pending()
+            self._pending = None
+            self.flush()
+
+    def close(self):
+        """Write every event, the file is left open"""
+        self._write_pending()
+        self._pending = None
+        self.flush()
+
+    def _write_pending(self):
+        if self._pending is None:
+            return
+        line = _ENCODER.encode([
+            round(self._pending.time, self.time_precision), self._pending.event_type,
+            ''.join(self._pending_data)
+        ]) + '\n'
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self.events += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
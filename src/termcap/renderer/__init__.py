@@ -1 +1,11 @@
-from .core import render_animation, render_still_frames
+_CORE_EXPORTS = ('render_animation', 'render_animation_incremental', 'render_animations', 'render_still_frames')
+
+__all__ = list(_CORE_EXPORTS)
+
+
+def __getattr__(name):
+    # The renderer depends on lxml and pyte, only import it when used
+    if name in _CORE_EXPORTS:
+        from termcap.renderer import core
+        return getattr(core, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
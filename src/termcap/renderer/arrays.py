@@ -0,0 +1,188 @@
+"""Array-backed representation of frames
+
+This module requires NumPy, which is an optional dependency installed with
+``pip install termcap[arrays]``. A frame is stored as a (rows, columns) array
+holding the codepoint of each cell and the id of its attributes in a table
+shared by every frame of a rendering. Comparing frames, finding changed rows
+and splitting a row into runs are then vectorized operations.
+"""
+import hashlib
+from typing import NamedTuple
+
+from wcwidth import wcswidth
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Cells whose text is not a single codepoint are stored as an index in a
+# table of texts, shifted past the last codepoint
+TEXT_TABLE_START = 0x110000
+_ATTRIBUTES_MASK = 0xFFFFFFFF
+
+def available() -> bool:
+    """Return True if NumPy is installed"""
+    return np is not None
+
+class ArrayFrame(NamedTuple):
+    """Cells of a frame as a (rows, columns) array
+
+    Each cell packs the text of the cell in its 32 high bits and the id of its
+    attributes in its 32 low bits, so both are compared at once.
+    """
+    cells: "np.ndarray"
+
+    @property
+    def codepoints(self) -> "np.ndarray":
+        return (self.cells >> 32).astype(np.uint32)
+
+    @property
+    def attributes(self) -> "np.ndarray":
+        return (self.cells & _ATTRIBUTES_MASK).astype(np.uint32)
+
+    def row_key(self, row: int) -> bytes:
+        """Return bytes identifying the content of a row"""
+        return self.cells[row].tobytes()
+
+    def digest(self) -> bytes:
+        """Return a hash of the content of the frame"""
+        return hashlib.blake2b(self.cells.tobytes(), digest_size=16).digest()
+
+def changed_rows(a: ArrayFrame, b: ArrayFrame) -> "np.ndarray":
+    """Return the indices of the rows that differ between two frames"""
+    return np.flatnonzero((a.cells != b.cells).any(axis=1))
+
+def runs(values) -> list:
+    """Return (start, end, value) for each run of equal non zero values"""
+    boundaries = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(values)]))
+    return [
+        (start, end, value)
+        for start, end, value in zip(starts.tolist(), ends.tolist(), values[starts].tolist())
+        if value
+    ]
+
+class FrameConverter:
+    """Convert the buffers of timed_frames() to ArrayFrames
+
+    The converter holds the tables of attributes and texts shared by the
+    frames. timed_frames() shares unchanged rows between consecutive buffers,
+    so only rows that are a different object than in the previous buffer are
+    converted again. Cells past the given geometry are ignored.
+    """
+    def __init__(self, columns: int, rows: int):
+        if np is None:
+            raise ImportError('Array frames require NumPy: pip install termcap[arrays]')
+
+        self.columns = columns
+        self.rows = rows
+        # Attributes of each id, as a CharacterCell without text, id 0
+        # standing for the columns that hold no cell
+        self.attributes = [None]
+        self._attribute_ids = {}
+        # Ids of the text style and of the background color of each attribute
+        # id, 0 standing for no text or the default background
+        self._style_ids = [0]
+        self._styles = {}
+        self._background_ids = [0]
+        self._backgrounds = {}
+        self.texts = []
+        self._text_ids = {}
+        # Packed codepoint and attribute id of each distinct CharacterCell
+        self._cells = {}
+        self._row_objects = [None] * rows
+        self._frame = ArrayFrame(np.zeros((rows, columns), dtype=np.uint64))
+
+    def convert(self, buffer) -> ArrayFrame:
+        """Return the ArrayFrame of a frame buffer"""
+        frame = None
+        for row, line_data in buffer.items():
+            if row >= self.rows or self._row_objects[row] is line_data:
+                continue
+            if frame is None:
+                frame = ArrayFrame(self._frame.cells.copy())
+            frame.cells[row] = self._convert_row(line_data)
+            self._row_objects[row] = line_data
+
+        if frame is not None:
+            self._frame = frame
+        return self._frame
+
+    def line_runs(self, frame: ArrayFrame, row: int):
+        """Same as svg.line_runs() for a row of an ArrayFrame"""
+        codepoints = frame.cells[row] >> 32
+        attribute_ids = frame.cells[row] & _ATTRIBUTES_MASK
+
+        text_runs = []
+        style_ids = np.asarray(self._style_ids, dtype=np.uint32)[attribute_ids]
+        for start, end, _ in runs(style_ids):
+            cell = self.attributes[attribute_ids[start]]
+            attributes = {
+                'color': cell.color,
+                'bold': cell.bold,
+                'italics': cell.italics,
+                'underscore': cell.underscore,
+                'strikethrough': cell.strikethrough,
+            }
+            text_runs.append((start, attributes, self._text(codepoints[start:end])))
+
+        background_runs = []
+        background_ids = np.asarray(self._background_ids, dtype=np.uint32)[attribute_ids]
+        for start, end, _ in runs(background_ids):
+            cell = self.attributes[attribute_ids[start]]
+            text = self._text(codepoints[start:end])
+            background_runs.append((start, wcswidth(text), cell.background_color))
+
+        return text_runs, background_runs
+
+    def _convert_row(self, line_data):
+        row = [0] * self.columns
+        cells = self._cells
+        for column, cell in line_data.items():
+            if column >= self.columns:
+                continue
+            try:
+                row[column] = cells[cell]
+            except KeyError:
+                text = cell.text
+                if len(text) == 1:
+                    codepoint = ord(text)
+                else:
+                    codepoint = TEXT_TABLE_START + self._text_id(text)
+                row[column] = cells[cell] = codepoint << 32 | self._attribute_id(cell)
+        return row
+
+    def _attribute_id(self, cell):
+        attributes = cell._replace(text='')
+        attribute_id = self._attribute_ids.get(attributes)
+        if attribute_id is None:
+            attribute_id = len(self.attributes)
+            self._attribute_ids[attributes] = attribute_id
+            self.attributes.append(attributes)
+
+            style = (cell.color, cell.bold, cell.italics, cell.underscore, cell.strikethrough)
+            self._style_ids.append(self._styles.setdefault(style, len(self._styles) + 1))
+            if cell.background_color == 'background':
+                self._background_ids.append(0)
+            else:
+                self._background_ids.append(
+                    self._backgrounds.setdefault(cell.background_color, len(self._backgrounds) + 1)
+                )
+        return attribute_id
+
+    def _text_id(self, text):
+        text_id = self._text_ids.get(text)
+        if text_id is None:
+            text_id = len(self.texts)
+            self._text_ids[text] = text_id
+            self.texts.append(text)
+        return text_id
+
+    def _text(self, codepoints):
+        return ''.join(
+            chr(codepoint) if codepoint < TEXT_TABLE_START
+            else self.texts[codepoint - TEXT_TABLE_START]
+            for codepoint in codepoints.tolist()
+        )
@@ -0,0 +1,121 @@
+"""Rendering of many casts to SVG animations
+
+Casts are rendered by a pool of worker processes which live for the whole
+batch, so the interpreter startup, configuration and templates are loaded
+once per worker rather than once per cast. The largest casts are scheduled
+first so that a long rendering does not start last and delay the end of the
+batch. A cast that fails to render is reported without stopping the others,
+and so is a cast whose worker dies: the casts left unfinished by the death
+of a worker are rendered again, each in a process of its own.
+"""
+import concurrent.futures
+import os
+import shutil
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, NamedTuple, Optional
+
+from termcap.parser.formats import read_records
+from termcap.renderer import theme
+from termcap.renderer.cache import RenderCache, animation_options, cache_key
+from termcap.renderer.core import RenderSummary, render_animation
+
+class BatchJob(NamedTuple):
+    cast_path: str
+    output_path: str
+
+class BatchResult(NamedTuple):
+    job: BatchJob
+    # None if the rendering failed or the animation was in the cache
+    summary: Optional[RenderSummary]
+    cached: bool = False
+    error: Optional[str] = None
+
+def render_batch(jobs: List[BatchJob], template_name: str, options: dict = None,
+                 workers: int = 1, use_cache: bool = True) -> Iterator[BatchResult]:
+    """Render casts to SVG animations, yielding results as they complete
+
+    ``options`` are keyword arguments of render_animation(). With
+    ``use_cache``, animations are looked up in and added to the render cache.
+    """
+    options = options or {}
+    jobs = sorted(jobs, key=_cast_size, reverse=True)
+    if workers == 1:
+        for job in jobs:
+            yield _render_job(job, template_name, options, use_cache)
+        return
+
+    # Tasks are handed to workers in submission order, largest first
+    unfinished = []
+    with _pool(workers, template_name) as executor:
+        futures = {
+            executor.submit(_render_job, job, template_name, options, use_cache): job
+            for job in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                # A worker died, e.g. killed for using too much memory. Every
+                # unfinished task fails with it, they are rendered again below.
+                unfinished.append(futures[future])
+            except Exception as e:
+                yield BatchResult(futures[future], None, error=f'{type(e).__name__}: {e}')
+    if not unfinished:
+        return
+
+    # Each remaining cast is rendered by a pool of its own, so that only the
+    # cast whose worker dies is reported as failed
+    unfinished.sort(key=_cast_size, reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_render_isolated_job, job, template_name, options, use_cache)
+            for job in unfinished
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+def _pool(workers, template_name):
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=theme.load_template, initargs=(template_name,)
+    )
+
+def _render_isolated_job(job, template_name, options, use_cache):
+    try:
+        with _pool(1, template_name) as executor:
+            return executor.submit(_render_job, job, template_name, options, use_cache).result()
+    except Exception as e:
+        return BatchResult(job, None, error=f'{type(e).__name__}: {e}')
+
+def _cast_size(job):
+    try:
+        return os.path.getsize(job.cast_path)
+    except OSError:
+        return 0
+
+def _render_job(job, template_name, options, use_cache):
+    try:
+        render_cache = key = None
+        if use_cache:
+            template_content = theme.load_template(template_name)
+            if template_content is not None:
+                render_cache = RenderCache()
+                key = cache_key(job.cast_path, template_content, animation_options(job.output_path, **options))
+                cached_path = render_cache.get(key)
+                if cached_path is not None:
+                    shutil.copyfile(cached_path, job.output_path)
+                    return BatchResult(job, None, cached=True)
+
+        records = read_records(job.cast_path)
+        try:
+            header = next(records)
+        except StopIteration:
+            raise ValueError('Empty input file')
+        summary = render_animation(records, header, job.output_path, template_name, **options)
+        if render_cache is not None:
+            try:
+                render_cache.put(key, job.output_path)
+            except OSError:
+                pass
+        return BatchResult(job, summary)
+    except Exception as e:
+        return BatchResult(job, None, error=f'{type(e).__name__}: {e}')
@@ -0,0 +1,140 @@
+"""Content addressed cache of rendered animations
+
+Entries are stored in TERMCAP_CACHE_DIR, named after a hash of everything the
+output depends on: the bytes of the cast and of the template, the version of
+termcap and the rendering options. The modification time of an entry is
+updated on every hit, so eviction drops the least recently used entries
+first.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+import termcap
+from termcap.const import TERMCAP_CACHE_DIR
+from termcap.renderer import compression
+
+RENDER_CACHE_DIR = TERMCAP_CACHE_DIR / 'renders'
+_CHUNK_SIZE = 1 << 20
+
+class CacheEntry(NamedTuple):
+    path: Path
+    size: int
+    last_used: float
+
+def cache_key(cast_path: str, template_content: bytes, options: dict) -> str:
+    """Return the key of the rendering of a cast with a template and options
+
+    options must be serializable as JSON.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        {'version': termcap.__version__, 'options': options}, sort_keys=True
+    ).encode())
+    digest.update(hashlib.sha256(template_content).digest())
+    with open(cast_path, 'rb') as cast_file:
+        for chunk in iter(lambda: cast_file.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def animation_options(output_path: str, min_frame_dur: int = 1, max_frame_dur: int = None,
+                      loop_delay: int = 1000, row_lifetimes: bool = False, max_fps: float = None,
+                      max_frames: int = None, compress: bool = False, compact: bool = False) -> dict:
+    """Return the options of cache_key() for an animation rendered to output_path
+
+    Arguments are those of core.render_animation() the output depends on,
+    so that every command rendering the same animation uses the same key.
+    """
+    return {
+        'min_frame_dur': min_frame_dur,
+        'max_frame_dur': max_frame_dur,
+        'loop_delay': loop_delay,
+        'row_lifetimes': row_lifetimes,
+        'max_fps': max_fps,
+        'max_frames': max_frames,
+        'compress': bool(compress or compression.is_compressed_path(output_path)),
+        'compact': compact,
+    }
+
+class RenderCache:
+    """Rendered animations keyed by cache_key()"""
+    def __init__(self, directory: Path = RENDER_CACHE_DIR):
+        self.directory = Path(directory)
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the path of the entry for key and mark it as used, or None
+
+        Entries of a cache that cannot be written, e.g. shared or read-only,
+        are returned without being marked.
+        """
+        path = self.directory / key
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            if not os.access(path, os.R_OK):
+                return None
+        return path
+
+    def put(self, key: str, source: str) -> Path:
+        """Store a copy of the file at source as the entry for key"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Copy then rename so that readers never see a partial entry
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as entry, open(source, 'rb') as source_file:
+                shutil.copyfileobj(source_file, entry)
+            path = self.directory / key
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        return path
+
+    def entries(self) -> List[CacheEntry]:
+        """Return the entries of the cache, least recently used first"""
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith('.'):
+                continue
+            stat = path.stat()
+            entries.append(CacheEntry(path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry.last_used)
+
+    def size(self) -> int:
+        """Return the total size of the entries in bytes"""
+        return sum(entry.size for entry in self.entries())
+
+    def evict(self, max_size: int = None, max_entries: int = None,
+              max_age: float = None) -> List[CacheEntry]:
+        """Remove least recently used entries until every limit is met
+
+        max_age is in seconds. Return the removed entries.
+        """
+        entries = self.entries()
+        total_size = sum(entry.size for entry in entries)
+        now = time.time()
+        removed = []
+        for entry in entries:
+            if not (
+                (max_size is not None and total_size > max_size)
+                or (max_entries is not None and len(entries) - len(removed) > max_entries)
+                or (max_age is not None and now - entry.last_used > max_age)
+            ):
+                break
+            entry.path.unlink()
+            total_size -= entry.size
+            removed.append(entry)
+        return removed
+
+    def clear(self) -> List[CacheEntry]:
+        """Remove every entry and return them"""
+        return self.evict(max_entries=0)
@@ -0,0 +1,143 @@
+"""Checkpoints of incremental renderings
+
+A checkpoint is a directory holding the spooled definitions and frames of an
+animation, along with the state needed to resume rendering after the last
+complete frame: the offset of the first unread line of the cast, the screen
+of the emulator, the pending records, and the line cache and frame writer of
+the rendering. Rendering a cast that only grew since the checkpoint then
+processes the new events alone.
+
+The state is stored as gzip compressed JSON: checkpoints live next to their
+output and may be committed or shared, and loading one must not be able to
+run code.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, NamedTuple, Optional
+
+import pyte
+
+import termcap
+from termcap.parser.asciicast import EventReader
+
+DEFINITIONS_FILE = 'defs'
+FRAMES_FILE = 'frames'
+_STATE_FILE = 'state.json.gz'
+_STATE_VERSION = 1
+
+class Checkpoint(NamedTuple):
+    # Identifies the termcap version, template and options of the rendering
+    key: str
+    offset: int
+    header_line: bytes
+    tail_digest: bytes
+    # Screen encoded by keyframes.encode_screen()
+    screen: dict
+    # Rows of the last frame, pending records, line cache and frame writer,
+    # encoded as JSON values by the renderer
+    rendering: dict
+    # Sizes of the spool files, and the offsets of their chunks for compact
+    # renderings
+    definitions_size: int
+    frames_size: int
+    definitions_offsets: Optional[List[int]]
+    frames_offsets: Optional[List[int]]
+
+def default_directory(output_path: str) -> str:
+    """Return the checkpoint directory of an output file"""
+    return f'{output_path}.checkpoint'
+
+def checkpoint_key(template_content: bytes, options: dict) -> str:
+    digest = hashlib.sha256(json.dumps(
+        {'version': termcap.__version__, 'options': options}, sort_keys=True
+    ).encode())
+    digest.update(template_content)
+    return digest.hexdigest()
+
+# Type of each field of a saved checkpoint
+_FIELD_TYPES = {
+    'key': str,
+    'offset': int,
+    'header_line': str,
+    'tail_digest': str,
+    'screen': dict,
+    'rendering': dict,
+    'definitions_size': int,
+    'frames_size': int,
+    'definitions_offsets': (list, type(None)),
+    'frames_offsets': (list, type(None)),
+}
+
+def load(directory: str) -> Optional[Checkpoint]:
+    """Return the checkpoint saved in directory, or None
+
+    A state file that is not a checkpoint of this version is ignored.
+    """
+    try:
+        with gzip.open(os.path.join(directory, _STATE_FILE), 'rb') as state_file:
+            data = json.loads(state_file.read())
+    except (OSError, ValueError, EOFError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != _STATE_VERSION:
+        return None
+    if not all(isinstance(data.get(name), types) for name, types in _FIELD_TYPES.items()):
+        return None
+    for offsets in (data['definitions_offsets'], data['frames_offsets']):
+        if offsets is not None and not all(isinstance(offset, int) for offset in offsets):
+            return None
+    try:
+        tail_digest = bytes.fromhex(data['tail_digest'])
+    except ValueError:
+        return None
+    return Checkpoint(**{
+        **{name: data[name] for name in _FIELD_TYPES},
+        'header_line': data['header_line'].encode('utf-8', 'surrogateescape'),
+        'tail_digest': tail_digest,
+    })
+
+def save(directory: str, checkpoint: Checkpoint):
+    data = json.dumps({
+        **checkpoint._asdict(),
+        'version': _STATE_VERSION,
+        'header_line': checkpoint.header_line.decode('utf-8', 'surrogateescape'),
+        'tail_digest': checkpoint.tail_digest.hex(),
+    }, separators=(',', ':')).encode()
+    write_atomic(os.path.join(directory, _STATE_FILE), gzip.compress(data, mtime=0))
+
+def write_atomic(path: str, data: bytes):
+    """Write data to path, replacing the file at once"""
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+def matches(checkpoint: Checkpoint, key: str, reader: EventReader) -> bool:
+    """Return True if rendering can resume from checkpoint
+
+    The rendering must use the same template and options, and the cast must
+    still have the header and the bytes before the offset of the checkpoint
+    it had when the checkpoint was saved, as far as EventReader.tail_digest()
+    tells.
+    """
+    return (
+        checkpoint.key == key
+        and checkpoint.header_line == reader.header_line
+        and reader.end() >= checkpoint.offset
+        and reader.tail_digest(checkpoint.offset) == checkpoint.tail_digest
+    )
+
+def between_sequences(stream: pyte.Stream) -> bool:
+    """Return True if the parser of stream is not in an escape sequence
+
+    The parser of pyte is a generator that cannot be saved, so the state of
+    an emulator can only be saved between escape sequences. This relies on
+    a private attribute of pyte, if it is missing the answer is False.
+    """
+    return getattr(stream, '_taking_plain_text', None) is True
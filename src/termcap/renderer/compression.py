@@ -0,0 +1,97 @@
+"""Compressed output of rendered documents
+
+Documents are compressed as they are written, so no compressed or
+uncompressed copy of the whole document is kept in memory. Brotli sidecars
+require the optional brotli package, installed with
+``pip install termcap[compression]``.
+"""
+import contextlib
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SIDECAR_FORMATS = ('gz', 'br')
+
+def brotli_available() -> bool:
+    """Return True if the brotli package is installed"""
+    return brotli is not None
+
+def is_compressed_path(path: str) -> bool:
+    """Return True if the extension of path calls for gzip compressed SVG"""
+    return path.endswith('.svgz')
+
+@contextlib.contextmanager
+def open_output(path: str, compress: bool = False, sidecars=()):
+    """Open path for writing a document, in binary mode
+
+    The document is gzip compressed if path ends in ``.svgz``, and
+    ``compress`` requires it to. For each format of ``sidecars`` ('gz' or
+    'br'), a copy of the uncompressed document compressed in that format is
+    written next to it, at path with the format appended as an extension. A
+    gzip sidecar of a compressed document would be a second copy of it and
+    is refused.
+    """
+    if compress and not is_compressed_path(path):
+        raise ValueError(f'Compressed output must end in .svgz: {path}')
+    if 'gz' in sidecars and is_compressed_path(path):
+        raise ValueError(f'A gzip sidecar of {path} would be a copy of it')
+    for sidecar in sidecars:
+        if sidecar not in SIDECAR_FORMATS:
+            raise ValueError(f'Unknown sidecar format: {sidecar}')
+        if sidecar == 'br' and brotli is None:
+            raise ImportError('Brotli sidecars require brotli: pip install termcap[compression]')
+
+    with contextlib.ExitStack() as stack:
+        if is_compressed_path(path):
+            output = stack.enter_context(_gzip_file(path))
+        else:
+            output = stack.enter_context(open(path, 'wb'))
+
+        outputs = [output]
+        for sidecar in sidecars:
+            sidecar_path = f'{path}.{sidecar}'
+            if sidecar == 'gz':
+                outputs.append(stack.enter_context(_gzip_file(sidecar_path)))
+            else:
+                outputs.append(stack.enter_context(_BrotliFile(sidecar_path)))
+
+        yield output if len(outputs) == 1 else _Tee(outputs)
+
+def _gzip_file(path):
+    # A fixed modification time keeps the output reproducible
+    return gzip.GzipFile(path, 'wb', compresslevel=9, mtime=0)
+
+class _Tee:
+    """Write to several files at once"""
+    def __init__(self, files):
+        self.files = files
+
+    def write(self, data):
+        for file in self.files:
+            file.write(data)
+        return len(data)
+
+class _BrotliFile:
+    """Write only file compressing its content with brotli"""
+    def __init__(self, path):
+        self._compressor = brotli.Compressor()
+        self._file = open(path, 'wb')
+
+    def write(self, data):
+        self._file.write(self._compressor.process(data))
+        return len(data)
+
+    def close(self):
+        try:
+            self._file.write(self._compressor.finish())
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
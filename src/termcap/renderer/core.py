@@ -1,14 +1,22 @@
 """Core rendering logic"""
-import copy
+import concurrent.futures
+import functools
+import heapq
+import math
 import os
-from typing import Iterator, List, Tuple, Dict
-from collections import defaultdict, namedtuple
+import re
+import shutil
+import tempfile
+from typing import Iterator, List, Tuple, Dict, NamedTuple
+from collections import Counter, defaultdict, deque, namedtuple
 
 import pyte
 from lxml import etree
 
 from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header
-from termcap.renderer import svg, theme
+from termcap.parser.formats import open_event_reader
+from termcap.parser.store import EventStore
+from termcap.renderer import arrays, checkpoint, compression, keyframes, svg, theme
 
 # Default size for a character cell rendered as SVG.
 CELL_WIDTH = 8
@@ -18,94 +26,523 @@ _COLORS = ["black", "red", "green", "brown", "blue", "magenta", "cyan", "white"]
 _BRIGHT_COLORS = [f"bright{color}" for color in _COLORS]
 NAMED_COLORS = _COLORS + _BRIGHT_COLORS
 pyte.graphics.FG_BG_256 = NAMED_COLORS + pyte.graphics.FG_BG_256[16:]
+# CSS class of each named color, bold text being drawn with the bright variant
+_COLOR_CLASSES = {name: f"color{index}" for index, name in enumerate(NAMED_COLORS)}
+_BOLD_COLOR_CLASSES = {
+    name: _COLOR_CLASSES.get(f"bright{name}", class_name)
+    for name, class_name in _COLOR_CLASSES.items()
+}
+# Number of distinct pyte Chars whose CharacterCell is kept for reuse
+CELL_CACHE_SIZE = 65536
 
 TimedFrame = namedtuple('TimedFrame', ['time', 'duration', 'buffer'])
 
+class RenderSummary(NamedTuple):
+    """Statistics about a rendering, for display by the CLI"""
+    frames: int
+    unique_frames: int
+    line_cache_hit_rate: float
+
 def render_animation(
     records: Iterator[AsciiCastV2Event],
     header: AsciiCastV2Header,
     output_path: str,
     template_name: str,
+    *args,
+    **kwargs
+):
+    """Render asciicast records to SVG animation
+
+    Other arguments are those of render_animations().
+    """
+    return render_animations(records, header, [(output_path, template_name)], *args, **kwargs)
+
+def render_animations(
+    records: Iterator[AsciiCastV2Event],
+    header: AsciiCastV2Header,
+    outputs: List[Tuple[str, str]],
     min_frame_dur: int = 1,
     max_frame_dur: int = None,
-    loop_delay: int = 1000
+    loop_delay: int = 1000,
+    array_frames: bool = False,
+    row_lifetimes: bool = False,
+    max_fps: float = None,
+    max_frames: int = None,
+    compress: bool = False,
+    sidecars: Tuple[str, ...] = (),
+    compact: bool = False,
+    screen: pyte.Screen = None
 ):
-    """Render asciicast records to SVG animation"""
+    """Render asciicast records to SVG animations, one per (output path, template name) of outputs
+
+    Frames and definitions are serialized as soon as they are produced and
+    spooled to temporary files, so memory use does not grow with the length
+    of the recording. The documents are assembled once the CSS animation,
+    which depends on every frame, is known. Frames do not depend on the
+    template: emulation and rendering happen once whatever the number of
+    outputs, only the assembly is repeated for each template.
+
+    By default frames are stacked vertically and the animation scrolls from
+    one to the next. A frame identical to an earlier one is not emitted
+    again: the animation scrolls back to the earlier frame instead. With
+    ``row_lifetimes``, each distinct line at each row position is emitted
+    once and shown only while it is on screen, so the size of the document
+    depends on the number of changes instead of frames times rows.
+
+    With ``array_frames``, frames are compared as NumPy arrays (see
+    termcap.renderer.arrays) instead of line by line.
+
+    ``max_fps`` and ``max_frames`` limit the number of frames, see
+    timed_frames().
+
+    Outputs are gzip compressed if their path ends in ``.svgz``, which
+    ``compress`` requires, and ``sidecars`` lists compressed copies to write
+    next to them (see compression.open_output()).
+
+    With ``compact``, styles are rendered as generated CSS classes, ids are
+    shortened and definitions used only once are inlined where they are used.
+
+    Emulation starts from ``screen`` if given, as returned by
+    keyframes.read_window().
+    """
     
-    # Load template
-    template_content = theme.load_template(template_name)
-    if not template_content:
-        raise ValueError(f"Template '{template_name}' not found")
+    # Load templates
+    template_contents = []
+    for _, template_name in outputs:
+        template_content = theme.load_template(template_name)
+        if not template_content:
+            raise ValueError(f"Template '{template_name}' not found")
+        template_contents.append(template_content)
         
     # Generate frames
     geometry, frames_generator = timed_frames(
-        records, header, min_frame_dur, max_frame_dur, loop_delay
+        records, header, min_frame_dur, max_frame_dur, loop_delay, max_fps, max_frames,
+        screen
     )
     
-    # Prepare SVG
-    columns, rows = geometry
-    root = svg.resize_template(template_content, columns, rows, CELL_WIDTH, CELL_HEIGHT)
+    line_cache = svg.LineCache(compact)
+    if row_lifetimes:
+        writer = _RowLifetimeWriter(compact)
+    else:
+        writer = _StackedFrameWriter(geometry[1])
     
-    # Clear existing screen content
-    screen_tag = root.find(f'.//{{{svg.SVG_NS}}}svg[@id="screen"]')
-    for child in screen_tag.getchildren():
-        screen_tag.remove(child)
+    with tempfile.TemporaryFile() as defs_file, tempfile.TemporaryFile() as frames_file:
+        if compact:
+            defs_file, frames_file = _Spool(defs_file), _Spool(frames_file)
         
-    # Add background rect
-    bg_rect = etree.Element('rect', {
-        'class': 'background',
-        'height': '100%',
-        'width': '100%',
-        'x': '0',
-        'y': '0'
+        # Render frames
+        if array_frames:
+            rendered_frames = _rendered_array_frames(frames_generator, line_cache, *geometry)
+        else:
+            rendered_frames = _rendered_frames(frames_generator, line_cache)
+        _write_frames(rendered_frames, writer, defs_file, frames_file)
+        
+        for (output_path, _), template_content in zip(outputs, template_contents):
+            _write_animation(
+                output_path, template_content, geometry, line_cache, writer,
+                defs_file, frames_file, compress, sidecars, compact
+            )
+
+    return RenderSummary(writer.frames, writer.unique_frames, line_cache.hit_rate)
+
+def render_animation_incremental(
+    cast_path: str,
+    output_path: str,
+    template_name: str,
+    min_frame_dur: int = 1,
+    max_frame_dur: int = None,
+    loop_delay: int = 1000,
+    row_lifetimes: bool = False,
+    max_fps: float = None,
+    compress: bool = False,
+    sidecars: Tuple[str, ...] = (),
+    compact: bool = False,
+    checkpoint_dir: str = None
+):
+    """Render an asciicast file to SVG animation, resuming from a checkpoint
+
+    Same as render_animation(), for a cast that may still be growing. The
+    definitions and frames are spooled to ``checkpoint_dir``, by default next
+    to the output, with a checkpoint of the rendering after its last complete
+    frame. If the checkpoint was saved for the same template and options and
+    the cast was only appended to since, rendering resumes from it and only
+    the new events are emulated.
+    """
+    template_content = theme.load_template(template_name)
+    if not template_content:
+        raise ValueError(f"Template '{template_name}' not found")
+    if checkpoint_dir is None:
+        checkpoint_dir = checkpoint.default_directory(output_path)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    key = checkpoint.checkpoint_key(template_content, {
+        'min_frame_dur': min_frame_dur,
+        'max_frame_dur': max_frame_dur,
+        'loop_delay': loop_delay,
+        'row_lifetimes': row_lifetimes,
+        'max_fps': max_fps,
+        'compact': compact,
     })
-    screen_tag.append(bg_rect)
-    
-    # Render frames
-    screen_view = etree.Element('g', attrib={'id': 'screen_view'})
-    definitions = {}
-    timings = {}
-    animation_duration = 0
-    
-    frames = list(frames_generator) # Consume generator
-    screen_height = rows * CELL_HEIGHT
+    reader = open_event_reader(cast_path)
+    header = reader.header
+    saved = checkpoint.load(checkpoint_dir)
+    restored = None
+    if saved is not None and checkpoint.matches(saved, key, reader):
+        try:
+            restored = _restore_rendering(saved, row_lifetimes)
+        except (KeyError, IndexError, TypeError, ValueError):
+            # Not a rendering saved by _encode_rendering()
+            pass
+    if restored is not None:
+        reader.offset = saved.offset
+        screen, rows, grouping_state, line_cache, writer = restored
+        spool_sizes = saved.definitions_size, saved.frames_size
+        spool_offsets = saved.definitions_offsets, saved.frames_offsets
+    else:
+        screen = rows = grouping_state = None
+        line_cache = svg.LineCache(compact)
+        if row_lifetimes:
+            writer = _RowLifetimeWriter(compact)
+        else:
+            writer = _StackedFrameWriter(header.height)
+        spool_sizes = 0, 0
+        spool_offsets = [], []
+
+    def save_checkpoint(screen, stream, rows, grouping_state):
+        if not writer.frames or not checkpoint.between_sequences(stream):
+            return
+        defs_file.flush()
+        frames_file.flush()
+        checkpoint.save(checkpoint_dir, checkpoint.Checkpoint(
+            key=key,
+            offset=reader.offset,
+            header_line=reader.header_line,
+            tail_digest=reader.tail_digest(reader.offset),
+            screen=keyframes.encode_screen(screen),
+            rendering=_encode_rendering(rows, grouping_state, line_cache, writer),
+            definitions_size=defs_file.tell(),
+            frames_size=frames_file.tell(),
+            definitions_offsets=getattr(defs_file, 'offsets', None),
+            frames_offsets=getattr(frames_file, 'offsets', None),
+        ))
+
+    geometry, frames_generator = timed_frames(
+        reader, header, min_frame_dur, max_frame_dur, loop_delay, max_fps,
+        screen=screen, rows=rows, grouping_state=grouping_state, on_last_group=save_checkpoint
+    )
     
-    for frame_count, frame in enumerate(frames):
-        rows_per_frame = rows + FRAME_CELL_SPACING
-        offset = frame_count * (rows_per_frame + rows_per_frame % 2) * CELL_HEIGHT
+    with _open_spool(checkpoint_dir, checkpoint.DEFINITIONS_FILE, spool_sizes[0]) as defs_file, \
+            _open_spool(checkpoint_dir, checkpoint.FRAMES_FILE, spool_sizes[1]) as frames_file:
+        if compact:
+            defs_file = _Spool(defs_file, spool_offsets[0])
+            frames_file = _Spool(frames_file, spool_offsets[1])
         
-        frame_group = etree.Element('g')
-        group_definitions = {}
+        rendered_frames = _rendered_frames(frames_generator, line_cache)
+        _write_frames(rendered_frames, writer, defs_file, frames_file)
         
-        for row_number, line_data in frame.buffer.items():
-            if line_data:
-                current_definitions = {**definitions, **group_definitions}
-                tags, new_defs = svg.render_line(
-                    offset, row_number, line_data, CELL_WIDTH, CELL_HEIGHT, current_definitions
-                )
-                for tag in tags:
+        _write_animation(
+            output_path, template_content, geometry, line_cache, writer,
+            defs_file, frames_file, compress, sidecars, compact
+        )
+
+    return RenderSummary(writer.frames, writer.unique_frames, line_cache.hit_rate)
+
+def _encode_rendering(rows, grouping_state, line_cache, writer):
+    """Return the state of an incremental rendering as JSON serializable values
+
+    Character cells are stored once in a table and referred to by their
+    position in it, lines as flat lists of columns and cell positions.
+    """
+    cells = {}
+
+    def encode_line(items):
+        return [item for column, cell in items for item in (column, cells.setdefault(cell, len(cells)))]
+
+    state = {
+        'rows': [[row, encode_line(line_data.items())] for row, line_data in rows.items()],
+        'grouping_state': dict(vars(grouping_state)),
+        'line_cache': line_cache.state(encode_line),
+        'writer': writer.state(),
+    }
+    state['cells'] = list(cells)
+    return state
+
+def _restore_rendering(saved, row_lifetimes):
+    """Return the screen, rows, grouping state, line cache and writer of a checkpoint"""
+    state = saved.rendering
+    cells = [svg.CharacterCell(*cell) for cell in state['cells']]
+
+    def decode_line(items):
+        return tuple(zip(items[::2], (cells[index] for index in items[1::2])))
+
+    rows = {row: dict(decode_line(items)) for row, items in state['rows']}
+    grouping_state = _GroupingState()
+    for name in vars(grouping_state):
+        setattr(grouping_state, name, state['grouping_state'][name])
+    line_cache = svg.LineCache.from_state(state['line_cache'], decode_line)
+    writer_class = _RowLifetimeWriter if row_lifetimes else _StackedFrameWriter
+    writer = writer_class.from_state(state['writer'])
+    return keyframes.decode_screen(saved.screen), rows, grouping_state, line_cache, writer
+
+def _decode_frame_key(value):
+    """Return the key of a frame written by _rendered_frames() decoded from JSON"""
+    return tuple((row_number, svg.decode_rendered_line(line)) for row_number, line in value)
+
+def _open_spool(directory, name, size):
+    """Open a spool file of a checkpoint, dropping what follows its first size bytes"""
+    spool_file = open(os.path.join(directory, name), 'a+b')
+    spool_file.truncate(size)
+    spool_file.seek(size)
+    return spool_file
+
+def _write_frames(rendered_frames, writer, defs_file, frames_file):
+    """Spool the definitions and the frames of rendered frames"""
+    for frame, frame_key, rendered_lines, new_defs in rendered_frames:
+        for definition in new_defs:
+            defs_file.write(etree.tostring(definition))
+        writer.write(frames_file, frame, frame_key, rendered_lines)
+
+def _write_animation(output_path, template_content, geometry, line_cache, writer,
+                     defs_file, frames_file, compress, sidecars, compact):
+    """Assemble the animation from the template and the spooled frames"""
+    columns, rows = geometry
+    root = svg.resize_template(template_content, columns, rows, CELL_WIDTH, CELL_HEIGHT)
+    _reset_screen(root)
+    writer.embed_css(root, line_cache.style_table)
+    head, tail = svg.split_template(root)
+    
+    with compression.open_output(output_path, compress, sidecars) as f:
+        f.write(head)
+        if compact:
+            _copy_inlining_definitions(f, defs_file, frames_file)
+        else:
+            _copy_element(f, b'<defs>', defs_file, b'</defs>')
+            _copy_element(f, b'<g id="screen_view">', frames_file, b'</g>')
+        f.write(tail)
+
+class _StackedFrameWriter:
+    """Write distinct frames one below the other
+
+    The CSS animation scrolls to the vertical offset of the current frame.
+    Writers are saved by state() so that a rendering can be resumed.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.frames = 0
+        self.duration = 0
+        # Offset of each distinct frame, keyed by its content
+        self.frame_offsets = {}
+        # Offset of the screen at the start time of each frame
+        self.timings = {}
+        self.last_offset = None
+
+    @property
+    def unique_frames(self):
+        return len(self.frame_offsets)
+
+    def write(self, frames_file, frame, frame_key, rendered_lines):
+        offset = self.frame_offsets.get(frame_key)
+        if offset is None:
+            rows_per_frame = self.rows + FRAME_CELL_SPACING
+            offset = len(self.frame_offsets) * (rows_per_frame + rows_per_frame % 2) * CELL_HEIGHT
+            self.frame_offsets[frame_key] = offset
+            
+            frame_group = etree.Element('g', nsmap={'xlink': svg.XLINK_NS})
+            for row_number, (group_id, background_runs) in rendered_lines:
+                for tag in svg.line_tags(
+                    offset, row_number, group_id, background_runs, CELL_WIDTH, CELL_HEIGHT
+                ):
                     frame_group.append(tag)
-                group_definitions.update(new_defs)
+            frames_file.write(svg.serialize(frame_group))
         
-        screen_view.append(frame_group)
-        definitions.update(group_definitions)
+        self.frames += 1
+        self.duration = frame.time + frame.duration
+        # Consecutive identical frames need no keyframe of their own
+        if offset != self.last_offset:
+            self.timings[frame.time] = -offset
+            self.last_offset = offset
+
+    def embed_css(self, root, style_table):
+        svg.embed_css(root, self.timings, self.duration, style_table)
+
+    def state(self):
+        return {
+            'rows': self.rows,
+            'frames': self.frames,
+            'duration': self.duration,
+            'frame_offsets': list(self.frame_offsets.items()),
+            'timings': list(self.timings.items()),
+            'last_offset': self.last_offset,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        writer = cls(state['rows'])
+        writer.frames = state['frames']
+        writer.duration = state['duration']
+        writer.frame_offsets = {
+            _decode_frame_key(frame_key): offset for frame_key, offset in state['frame_offsets']
+        }
+        writer.timings = dict(state['timings'])
+        writer.last_offset = state['last_offset']
+        return writer
+
+class _RowLifetimeWriter:
+    """Write each distinct line at each row position once
+
+    The CSS animation shows each written element only during the intervals of
+    time it is on screen.
+    """
+    def __init__(self, compact=False):
+        self.compact = compact
+        self.frames = 0
+        self.duration = 0
+        # Id of the element of each (row_number, rendered_line) written so far
+        self.element_ids = {}
+        # Intervals of time each element was on screen, keyed by its id
+        self.lifetimes = defaultdict(list)
+        # Element on screen at each row and the time it appeared
+        self.on_screen = {}
+        self.frame_keys = set()
+
+    @property
+    def unique_frames(self):
+        return len(self.frame_keys)
+
+    def write(self, frames_file, frame, frame_key, rendered_lines):
+        self.frame_keys.add(frame_key)
         
-        animation_duration = frame.time + frame.duration
-        timings[frame.time] = -offset
+        visible = {}
+        for row_number, rendered_line in rendered_lines:
+            element_id = self.element_ids.get((row_number, rendered_line))
+            if element_id is None:
+                if self.compact:
+                    element_id = 'r' + svg.base62(len(self.element_ids))
+                else:
+                    element_id = 'r{}'.format(len(self.element_ids) + 1)
+                self.element_ids[row_number, rendered_line] = element_id
+                frames_file.write(_row_element(element_id, row_number, rendered_line))
+            visible[row_number] = element_id
         
-    # Add definitions
-    defs_tag = etree.SubElement(screen_tag, 'defs')
-    for definition in definitions.values():
-        defs_tag.append(definition)
+        for row_number in set(self.on_screen) | set(visible):
+            element_id = visible.get(row_number)
+            if row_number in self.on_screen:
+                shown_id, start = self.on_screen[row_number]
+                if shown_id == element_id:
+                    continue
+                del self.on_screen[row_number]
+                if frame.time > start:
+                    self.lifetimes[shown_id].append((start, frame.time))
+            if element_id is not None:
+                self.on_screen[row_number] = element_id, frame.time
         
-    screen_tag.append(screen_view)
-    
-    # Add CSS animation
-    svg.embed_css(root, timings, animation_duration)
-    
-    # Write output
-    with open(output_path, 'wb') as f:
-        f.write(etree.tostring(root))
+        self.frames += 1
+        self.duration = frame.time + frame.duration
+
+    def embed_css(self, root, style_table):
+        # Elements still on screen stay until the end of the animation
+        lifetimes = {element_id: list(intervals) for element_id, intervals in self.lifetimes.items()}
+        for element_id, start in self.on_screen.values():
+            if self.duration > start:
+                lifetimes.setdefault(element_id, []).append((start, self.duration))
+        svg.embed_visibility_css(root, lifetimes, self.duration, style_table)
+
+    def state(self):
+        return {
+            'compact': self.compact,
+            'frames': self.frames,
+            'duration': self.duration,
+            'element_ids': list(self.element_ids.items()),
+            'lifetimes': self.lifetimes,
+            'on_screen': list(self.on_screen.items()),
+            'frame_keys': list(self.frame_keys),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        writer = cls(state['compact'])
+        writer.frames = state['frames']
+        writer.duration = state['duration']
+        writer.element_ids = {
+            (row_number, svg.decode_rendered_line(line)): element_id
+            for (row_number, line), element_id in state['element_ids']
+        }
+        for element_id, intervals in state['lifetimes'].items():
+            writer.lifetimes[element_id] = [tuple(interval) for interval in intervals]
+        writer.on_screen = {
+            row_number: tuple(shown) for row_number, shown in state['on_screen']
+        }
+        writer.frame_keys = {_decode_frame_key(frame_key) for frame_key in state['frame_keys']}
+        return writer
+
+def _row_element(element_id, row_number, rendered_line):
+    """Serialize the element showing a rendered line at a row of the screen"""
+    group_id, background_runs = rendered_line
+    element = etree.Element('g', {'id': element_id}, nsmap={'xlink': svg.XLINK_NS})
+    element.extend(
+        svg.line_tags(0, row_number, group_id, background_runs, CELL_WIDTH, CELL_HEIGHT)
+    )
+    return svg.serialize(element)
+
+def _rendered_frames(frames, line_cache):
+    """Render the lines of each frame through the line cache
+
+    Yield each frame with a key identifying its content, the list of its
+    (row_number, rendered_line) and the definitions it adds.
+    """
+    for frame in frames:
+        rendered_lines = []
+        new_defs = []
+        for row_number, line_data in frame.buffer.items():
+            if line_data:
+                rendered_line, line_defs = line_cache.lookup(line_data, CELL_WIDTH)
+                rendered_lines.append((row_number, rendered_line))
+                new_defs.extend(line_defs.values())
+        yield frame, tuple(rendered_lines), rendered_lines, new_defs
+
+def _rendered_array_frames(frames, line_cache, columns, rows):
+    """Same as _rendered_frames() with frames converted to arrays
+
+    Only the rows that differ from the previous frame are looked up in the
+    line cache, and frames are keyed by a digest of their arrays. The other
+    rows are counted as hits of the line cache, as _rendered_frames() finds
+    them there, so that both report the same hit rate.
+    """
+    converter = arrays.FrameConverter(columns, rows)
+    rendered_rows = [None] * rows
+    previous = None
+    for frame in frames:
+        array_frame = converter.convert(frame.buffer)
+        if previous is None:
+            changed_rows = range(rows)
+        else:
+            changed_rows = arrays.changed_rows(previous, array_frame).tolist()
+        previous = array_frame
+        
+        new_defs = []
+        looked_up = 0
+        for row_number in changed_rows:
+            if not array_frame.attributes[row_number].any():
+                rendered_rows[row_number] = None
+                continue
+            looked_up += 1
+            key = array_frame.row_key(row_number)
+            rendered_line = line_cache.get(key)
+            if rendered_line is None:
+                text_runs, background_runs = converter.line_runs(array_frame, row_number)
+                rendered_line, line_defs = line_cache.add(
+                    key, text_runs, background_runs, CELL_WIDTH
+                )
+                new_defs.extend(line_defs.values())
+            rendered_rows[row_number] = rendered_line
+        
+        rendered_lines = [
+            (row_number, rendered_line)
+            for row_number, rendered_line in enumerate(rendered_rows)
+            if rendered_line is not None
+        ]
+        line_cache.hits += len(rendered_lines) - looked_up
+        yield frame, array_frame.digest(), rendered_lines, new_defs
 
 def render_still_frames(
     records: Iterator[AsciiCastV2Event],
@@ -114,87 +551,408 @@ def render_still_frames(
     template_name: str,
     min_frame_dur: int = 1,
     max_frame_dur: int = None,
-    loop_delay: int = 1000
+    loop_delay: int = 1000,
+    jobs: int = 1,
+    max_fps: float = None,
+    max_frames: int = None,
+    compress: bool = False,
+    screen: pyte.Screen = None
 ):
-    """Render asciicast records to still SVG frames"""
+    """Render asciicast records to still SVG frames
+
+    Terminal emulation is sequential but frames are independent once their
+    buffer is known: with ``jobs`` greater than 1 they are rendered and
+    written by a pool of worker processes.
+
+    With ``compress``, frames are written as gzip compressed .svgz files.
+
+    Emulation starts from ``screen`` if given.
+    """
     template_content = theme.load_template(template_name)
     if not template_content:
         raise ValueError(f"Template '{template_name}' not found")
         
     geometry, frames_generator = timed_frames(
-        records, header, min_frame_dur, max_frame_dur, loop_delay
+        records, header, min_frame_dur, max_frame_dur, loop_delay, max_fps, max_frames,
+        screen
     )
     columns, rows = geometry
-    root = svg.resize_template(template_content, columns, rows, CELL_WIDTH, CELL_HEIGHT)
     
     os.makedirs(output_dir, exist_ok=True)
+    extension = 'svgz' if compress else 'svg'
+    # Hashes of the content of the frames, kept instead of the frames
+    # themselves to count the distinct ones
+    frame_hashes = set()
+
+    def paths_and_buffers():
+        for i, frame in enumerate(frames_generator):
+            frame_hashes.add(hash(tuple(
+                (row_number, tuple(sorted(line_data.items())))
+                for row_number, line_data in frame.buffer.items() if line_data
+            )))
+            yield os.path.join(output_dir, f'frame_{i:05d}.{extension}'), frame.buffer
     
-    for i, frame in enumerate(frames_generator):
-        frame_root = copy.deepcopy(root)
-        screen_tag = frame_root.find(f'.//{{{svg.SVG_NS}}}svg[@id="screen"]')
-        for child in screen_tag.getchildren():
-            screen_tag.remove(child)
-            
-        bg_rect = etree.Element('rect', {
-            'class': 'background',
-            'height': '100%',
-            'width': '100%',
-            'x': '0',
-            'y': '0'
-        })
-        screen_tag.append(bg_rect)
-        
-        definitions = {}
-        frame_group = etree.Element('g')
+    frame_count = 0
+    hits = misses = 0
+    if jobs > 1:
+        results = _map_bounded(
+            _write_still_frame_in_worker,
+            paths_and_buffers(),
+            jobs,
+            _init_still_frame_worker,
+            (template_content, columns, rows),
+        )
+    else:
+        head, tail = _still_frame_template(template_content, columns, rows)
+        results = (
+            _write_still_frame(head, tail, path, buffer) for path, buffer in paths_and_buffers()
+        )
         
-        for row_number, line_data in frame.buffer.items():
-            if line_data:
-                tags, new_defs = svg.render_line(
-                    0, row_number, line_data, CELL_WIDTH, CELL_HEIGHT, definitions
-                )
-                for tag in tags:
-                    frame_group.append(tag)
-                definitions.update(new_defs)
-                
-        defs_tag = etree.SubElement(screen_tag, 'defs')
-        for definition in definitions.values():
-            defs_tag.append(definition)
-            
-        screen_tag.append(frame_group)
-        svg.embed_css(frame_root, None, None)
+    for frame_hits, frame_misses in results:
+        frame_count += 1
+        hits += frame_hits
+        misses += frame_misses
+
+    hit_rate = hits / (hits + misses) if hits + misses else 0.0
+    return RenderSummary(frame_count, len(frame_hashes), hit_rate)
+
+def _still_frame_template(template_content, columns, rows):
+    """Return the serialized template before and after the content of a still frame"""
+    root = svg.resize_template(template_content, columns, rows, CELL_WIDTH, CELL_HEIGHT)
+    _reset_screen(root)
+    svg.embed_css(root, None, None)
+    return svg.split_template(root)
+
+def _write_still_frame(head, tail, path, buffer):
+    """Write a still frame and return the hits and misses of its line cache"""
+    line_cache = svg.LineCache()
+    definitions = []
+    frame_group = etree.Element('g', nsmap={'xlink': svg.XLINK_NS})
+    
+    for row_number, line_data in buffer.items():
+        if line_data:
+            tags, new_defs = line_cache.render_line(
+                0, row_number, line_data, CELL_WIDTH, CELL_HEIGHT
+            )
+            for tag in tags:
+                frame_group.append(tag)
+            definitions.extend(etree.tostring(d) for d in new_defs.values())
+    
+    with compression.open_output(path) as f:
+        f.write(head)
+        if definitions:
+            f.write(b'<defs>')
+            f.writelines(definitions)
+            f.write(b'</defs>')
+        else:
+            f.write(b'<defs/>')
+        f.write(svg.serialize(frame_group))
+        f.write(tail)
+    return line_cache.hits, line_cache.misses
+
+# Serialized template of a worker process of render_still_frames
+_worker_template = None
+
+def _init_still_frame_worker(template_content, columns, rows):
+    global _worker_template
+    _worker_template = _still_frame_template(template_content, columns, rows)
+
+def _write_still_frame_in_worker(path_and_buffer):
+    path, buffer = path_and_buffer
+    return _write_still_frame(*_worker_template, path, buffer)
+
+def _map_bounded(function, iterable, jobs, initializer, initargs):
+    """Like ProcessPoolExecutor.map() but without consuming ``iterable`` upfront
+
+    At most a few tasks per worker are pending at any time, which bounds the
+    number of frame buffers held in memory. Results are yielded in order.
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=initializer, initargs=initargs
+    ) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 4 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _reset_screen(root):
+    """Replace the content of svg#screen with a background rect"""
+    screen_tag = root.find(f'.//{{{svg.SVG_NS}}}svg[@id="screen"]')
+    for child in screen_tag.getchildren():
+        screen_tag.remove(child)
         
-        with open(os.path.join(output_dir, f'frame_{i:05d}.svg'), 'wb') as f:
-            f.write(etree.tostring(frame_root))
+    bg_rect = etree.Element('rect', {
+        'class': 'background',
+        'height': '100%',
+        'width': '100%',
+        'x': '0',
+        'y': '0'
+    })
+    screen_tag.append(bg_rect)
+    return screen_tag
+
+def _copy_element(output, start_tag, spool_file, end_tag):
+    """Write an element whose content was spooled to a temporary file"""
+    if not spool_file.tell():
+        output.write(start_tag[:-1] + b'/>')
+        return
+    output.write(start_tag)
+    spool_file.seek(0)
+    shutil.copyfileobj(spool_file, output)
+    output.write(end_tag)
+
+class _Spool:
+    """Temporary file remembering the chunks written to it
+
+    Each write is expected to be a whole element, so that the elements can be
+    read back one by one.
+    """
+    def __init__(self, file, offsets=None):
+        self.file = file
+        self.offsets = [] if offsets is None else offsets
+
+    def write(self, data):
+        self.offsets.append(self.file.tell())
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+
+    def chunks(self):
+        """Generate (offset, bytes) for each chunk written"""
+        end = self.file.seek(0, os.SEEK_END)
+        for offset, next_offset in zip(self.offsets, self.offsets[1:] + [end]):
+            self.file.seek(offset)
+            yield offset, self.file.read(next_offset - offset)
+
+    def read_at(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+_USE_PATTERN = re.compile(rb'<use xlink:href="#([^"]+)" y="(\d+)"/>')
+_DEFINITION_START_PATTERN = re.compile(rb'<g id="([^"]+)">')
+
+def _copy_inlining_definitions(output, defs_spool, frames_spool):
+    """Write the definitions and the frames of a compact rendering
+
+    Definitions referenced by a single <use> tag are written in place of the
+    tag, as a group translated to its position, instead of in <defs>.
+    """
+    references = Counter(
+        group_id
+        for _, chunk in frames_spool.chunks()
+        for group_id, _ in _USE_PATTERN.findall(chunk)
+    )
+
+    # Location in the definitions spool of the content of inlined groups
+    inlined = {}
+    output.write(b'<defs>')
+    for offset, chunk in defs_spool.chunks():
+        start = _DEFINITION_START_PATTERN.match(chunk)
+        if references[start.group(1)] == 1:
+            inlined[start.group(1)] = offset + start.end(), len(chunk) - start.end()
+        else:
+            output.write(chunk)
+    output.write(b'</defs>')
+
+    def inline(match):
+        location = inlined.get(match.group(1))
+        if location is None:
+            return match.group(0)
+        y = match.group(2)
+        start_tag = b'<g>' if y == b'0' else b'<g transform="translate(0,' + y + b')">'
+        return start_tag + defs_spool.read_at(*location)
+
+    output.write(b'<g id="screen_view">')
+    for _, chunk in frames_spool.chunks():
+        output.write(_USE_PATTERN.sub(inline, chunk))
+    output.write(b'</g>')
 
-def timed_frames(records, header, min_frame_dur, max_frame_dur, last_frame_dur):
-    """Generate TimedFrame objects from records"""
+def timed_frames(records, header, min_frame_dur, max_frame_dur, last_frame_dur,
+                 max_fps=None, max_frames=None, screen=None, rows=None, grouping_state=None,
+                 on_last_group=None):
+    """Generate TimedFrame objects from records
+
+    ``max_fps`` raises the minimum duration of frames accordingly. With
+    ``max_frames``, frames are merged with their successor as they are
+    generated so that at most ``max_frames`` are buffered (see
+    _merge_frames()).
+
+    Emulation resumes from ``screen``, the ``rows`` of the last frame and
+    ``grouping_state`` if given. When every record has been read,
+    on_last_group(screen, stream, rows, grouping_state) is called before the
+    last group of records, which holds the pending records and lasts
+    ``last_frame_dur``, is fed to the screen.
+    """
     
     if not max_frame_dur and header.idle_time_limit:
         max_frame_dur = int(header.idle_time_limit * 1000)
+    if max_fps:
+        min_frame_dur = max(min_frame_dur, math.ceil(1000 / max_fps))
         
     def generator():
-        screen = pyte.Screen(header.width, header.height)
+        nonlocal screen, rows, grouping_state
+        if screen is None:
+            screen = pyte.Screen(header.width, header.height)
+        if rows is None:
+            # Rows converted so far, shared between consecutive frames
+            rows = {}
+        if grouping_state is None:
+            grouping_state = _GroupingState()
         stream = pyte.Stream(screen)
         
         # Group records by time
-        grouped_records = _group_by_time(records, min_frame_dur, max_frame_dur, last_frame_dur)
+        grouped_records = _group_by_time(
+            records, min_frame_dur, max_frame_dur, last_frame_dur, grouping_state
+        )
         
         for record in grouped_records:
+            if grouping_state.done and on_last_group is not None:
+                on_last_group(screen, stream, rows, grouping_state)
             stream.feed(record.event_data)
             yield TimedFrame(
                 int(1000 * record.time),
                 int(1000 * record.duration),
-                _screen_buffer(screen)
+                _screen_buffer(screen, rows)
             )
             
+    if max_frames:
+        return (header.width, header.height), _merge_frames(generator(), max_frames)
     return (header.width, header.height), generator()
 
+def _merge_frames(frames, max_frames):
+    """Merge frames until at most max_frames remain
+
+    Merging a frame into its successor means the successor is shown from the
+    start time of the frame, so the total duration is preserved. The frames
+    merged first are the ones whose successor differs the least from them,
+    weighted by how long they are shown: frames shown briefly or followed by
+    a small change are the least noticeable when dropped.
+
+    Frames are merged as they are read, as soon as more than max_frames are
+    held, so memory use depends on max_frames and not on the length of the
+    recording. The frames are yielded once every frame has been read.
+    """
+    # Frames held, keyed by their position in frames, with their start and
+    # end times and the number of cells changed since the previous frame.
+    # After a merge, the change of the successor is bounded by the sum of
+    # both changes.
+    buffers = {}
+    starts = {}
+    ends = {}
+    changes = {}
+    successors = {}
+    predecessors = {}
+    # Version of the cost of each frame, so that outdated heap entries can be
+    # told apart
+    versions = {}
+    heap = []
+    first = None
+    previous = None
+
+    def cost(i):
+        return changes[successors[i]] * (ends[i] - starts[i])
+
+    def push(i):
+        versions[i] += 1
+        heapq.heappush(heap, (cost(i), i, versions[i]))
+
+    for j, frame in enumerate(frames):
+        buffers[j] = frame.buffer
+        starts[j] = frame.time
+        ends[j] = frame.time + frame.duration
+        changes[j] = _changed_cells({} if previous is None else previous, frame.buffer)
+        successors[j] = None
+        predecessors[j] = None if first is None else j - 1
+        versions[j] = 0
+        previous = frame.buffer
+        if first is None:
+            first = j
+        else:
+            # The last frame read before j is held, it is never merged before
+            # its successor is known
+            successors[j - 1] = j
+            push(j - 1)
+
+        while len(buffers) > max_frames:
+            _, i, version = heapq.heappop(heap)
+            if version != versions.get(i) or successors[i] is None:
+                continue
+
+            successor = successors[i]
+            predecessor = predecessors[i]
+            starts[successor] = starts[i]
+            changes[successor] += changes[i]
+            predecessors[successor] = predecessor
+            for table in (buffers, starts, ends, changes, successors, predecessors, versions):
+                del table[i]
+
+            # The cost of the successor depends on its duration and the cost
+            # of the predecessor on the change of its new successor
+            if predecessor is None:
+                first = successor
+            else:
+                successors[predecessor] = successor
+                push(predecessor)
+            if successors[successor] is not None:
+                push(successor)
 
-def _group_by_time(records, min_rec_duration, max_rec_duration, last_rec_duration):
+        # Drop outdated entries so that the heap does not grow with the
+        # number of frames read
+        if len(heap) > 4 * (max_frames + 1):
+            heap = [
+                (cost(i), i, versions[i]) for i in buffers if successors[i] is not None
+            ]
+            heapq.heapify(heap)
+
+    i = first
+    while i is not None:
+        yield TimedFrame(starts[i], ends[i] - starts[i], buffers[i])
+        i = successors[i]
+
+def _changed_cells(previous, buffer):
+    """Count the cells that differ between two frame buffers"""
+    count = 0
+    for row in previous.keys() | buffer.keys():
+        previous_line = previous.get(row, {})
+        line = buffer.get(row, {})
+        if previous_line is line:
+            continue
+        count += sum(
+            previous_line.get(column) != line.get(column)
+            for column in previous_line.keys() | line.keys()
+        )
+    return count
+
+class _GroupingState:
+    """Position of _group_by_time() in the records
+
+    The pending records are the ones that will be grouped with the next
+    records, done is set once every record has been read.
+    """
+    def __init__(self):
+        self.current_string = ''
+        self.current_time = 0
+        self.dropped_time = 0
+        self.done = False
+
+def _group_by_time(records, min_rec_duration, max_rec_duration, last_rec_duration, state=None):
     """Group events by time"""
-    current_string = ''
-    current_time = 0
-    dropped_time = 0
+    if state is None:
+        state = _GroupingState()
+    if isinstance(records, EventStore):
+        yield from _group_store_by_time(records, min_rec_duration, max_rec_duration, last_rec_duration, state)
+        return
+    state.done = False
+    current_string = state.current_string
+    current_time = state.current_time
+    dropped_time = state.dropped_time
     
     if max_rec_duration:
         max_rec_duration /= 1000.0
@@ -221,6 +979,10 @@ def _group_by_time(records, min_rec_duration, max_rec_duration, last_rec_duratio
             
         current_string += event.event_data
         
+    state.current_string = current_string
+    state.current_time = current_time
+    state.dropped_time = dropped_time
+    state.done = True
     yield AsciiCastV2Event(
         time=current_time,
         event_type='o',
@@ -228,14 +990,77 @@ def _group_by_time(records, min_rec_duration, max_rec_duration, last_rec_duratio
         duration=last_rec_duration / 1000.0
     )
 
+def _group_store_by_time(store, min_rec_duration, max_rec_duration, last_rec_duration, state):
+    """Group the events of an EventStore by time, see _group_by_time()
 
-def _screen_buffer(screen):
-    buffer = defaultdict(dict)
-    for row in range(screen.lines):
-        buffer[row] = {
-            column: _char_to_cell(screen.buffer[row][column])
-            for column in screen.buffer[row]
-        }
+    Groups are delimited by index in the columns of the store and the data
+    of each group is decoded at once.
+    """
+    state.done = False
+    current_string = state.current_string
+    current_time = state.current_time
+    dropped_time = state.dropped_time
+    
+    if max_rec_duration:
+        max_rec_duration /= 1000.0
+
+    output_code = store.type_code('o')
+    group_start = 0
+    for index, (time, code) in enumerate(zip(store.times, store.types)):
+        if code != output_code:
+            continue
+
+        time_between_events = time - (current_time + dropped_time)
+        if time_between_events * 1000 >= min_rec_duration:
+            if max_rec_duration and max_rec_duration < time_between_events:
+                dropped_time += time_between_events - max_rec_duration
+                time_between_events = max_rec_duration
+
+            yield AsciiCastV2Event(
+                time=current_time,
+                event_type='o',
+                event_data=current_string + store.joined_data(group_start, index),
+                duration=time_between_events
+            )
+
+            current_string = ''
+            current_time += time_between_events
+            group_start = index
+
+    state.current_string = current_string + store.joined_data(group_start, len(store))
+    state.current_time = current_time
+    state.dropped_time = dropped_time
+    state.done = True
+    yield AsciiCastV2Event(
+        time=current_time,
+        event_type='o',
+        event_data=state.current_string,
+        duration=last_rec_duration / 1000.0
+    )
+
+def _screen_buffer(screen, rows=None):
+    """Snapshot the screen as a mapping of row number to {column: CharacterCell}
+
+    When ``rows`` is given it holds the rows of the previous snapshot and is
+    updated in place: only the lines pyte marked as dirty since then are
+    converted again, the other rows are shared by reference between
+    snapshots. Rows of the returned buffer must be treated as read-only.
+    """
+    if rows is None:
+        rows = {}
+        dirty_rows = range(screen.lines)
+    else:
+        dirty_rows = screen.dirty
+
+    for row in dirty_rows:
+        if row < screen.lines:
+            rows[row] = {
+                column: _char_to_cell(char)
+                for column, char in screen.buffer[row].items()
+            }
+    screen.dirty.clear()
+
+    buffer = defaultdict(dict, rows)
     
     # Cursor
     if not screen.cursor.hidden:
@@ -252,36 +1077,28 @@ def _screen_buffer(screen):
                 bg=screen.cursor.attrs.bg,
                 reverse=True
             )
-            buffer[row][column] = _char_to_cell(cursor_char)
+            # Copy the row so that the cursor does not leak into other frames
+            buffer[row] = {**buffer[row], column: _char_to_cell(cursor_char)}
             
     return buffer
 
+@functools.lru_cache(maxsize=CELL_CACHE_SIZE)
 def _char_to_cell(char):
+    """Convert a pyte Char to a CharacterCell
+
+    pyte Chars are hashable, so conversions are memoized and every occurrence
+    of a Char in every frame shares a single interned CharacterCell.
+    """
     if char.fg == "default":
         text_color = "foreground"
     else:
-        if char.bold and not str(char.fg).startswith("bright"):
-            named_color = f"bright{char.fg}"
-        else:
-            named_color = char.fg
-
-        if named_color in NAMED_COLORS:
-            text_color = f"color{NAMED_COLORS.index(named_color)}"
-        elif len(str(char.fg)) == 6:
-            int(str(char.fg), 16)
-            text_color = f"#{char.fg}"
-        else:
-            raise ValueError(f"Invalid foreground color: {char.fg}")
+        color_classes = _BOLD_COLOR_CLASSES if char.bold else _COLOR_CLASSES
+        text_color = color_classes.get(char.fg) or _hex_color(char.fg, "foreground")
 
     if char.bg == "default":
         background_color = "background"
-    elif char.bg in NAMED_COLORS:
-        background_color = f"color{NAMED_COLORS.index(char.bg)}"
-    elif len(str(char.bg)) == 6:
-        int(str(char.bg), 16)
-        background_color = f"#{char.bg}"
     else:
-        raise ValueError(f"Invalid background color: {char.bg}")
+        background_color = _COLOR_CLASSES.get(char.bg) or _hex_color(char.bg, "background")
 
     if char.reverse:
         text_color, background_color = background_color, text_color
@@ -295,3 +1112,9 @@ def _char_to_cell(char):
         underscore=char.underscore,
         strikethrough=char.strikethrough
     )
+
+def _hex_color(color, kind):
+    if len(str(color)) == 6:
+        int(str(color), 16)
+        return f"#{color}"
+    raise ValueError(f"Invalid {kind} color: {color}")
@@ -0,0 +1,250 @@
+"""Keyframe index of asciicast files
+
+An index holds snapshots of the emulator screen taken every ``interval``
+seconds of the recording, with the offset in the cast of the first event
+that follows each snapshot. Rendering a window of the recording then starts
+from the last snapshot before the window instead of emulating every event
+since the start.
+
+Building an index emulates the whole cast once. An index of a cast that grew
+since is extended from its last keyframe.
+
+Indexes are stored in TERMCAP_CACHE_DIR, named after the path of the cast,
+as gzip compressed JSON: casts are often shared, and a file found next to
+one must not be able to run code when loaded.
+"""
+import gzip
+import hashlib
+import json
+import os
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import pyte
+from pyte.screens import Char, Cursor, Margins, Savepoint
+
+from termcap.const import TERMCAP_CACHE_DIR
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header
+from termcap.parser.formats import open_event_reader
+from termcap.renderer import checkpoint
+
+INDEX_DIR = TERMCAP_CACHE_DIR / 'keyframes'
+INDEX_SUFFIX = '.tcidx'
+INDEX_VERSION = 1
+DEFAULT_INTERVAL = 30.0
+
+class Keyframe(NamedTuple):
+    # Time of the first event following the snapshot
+    time: float
+    offset: int
+    # Screen encoded by encode_screen()
+    screen: dict
+
+class KeyframeIndex(NamedTuple):
+    interval: float
+    header_line: bytes
+    # Offset up to which the cast is indexed, and EventReader.tail_digest() there
+    offset: int
+    tail_digest: bytes
+    keyframes: List[Keyframe]
+
+def index_path(cast_path: str) -> str:
+    name = hashlib.sha256(os.path.abspath(cast_path).encode('utf-8', 'surrogateescape')).hexdigest()
+    return str(INDEX_DIR / (name + INDEX_SUFFIX))
+
+def load_index(cast_path: str, interval: float = DEFAULT_INTERVAL) -> Optional[KeyframeIndex]:
+    """Return the index of a cast, or None if it is missing or outdated
+
+    An index of a cast that was only appended to since is returned as is.
+    """
+    try:
+        with gzip.open(index_path(cast_path), 'rb') as index_file:
+            data = json.loads(index_file.read())
+        if data['version'] != INDEX_VERSION:
+            return None
+        index = KeyframeIndex(
+            interval=data['interval'],
+            header_line=data['header_line'].encode('utf-8', 'surrogateescape'),
+            offset=data['offset'],
+            tail_digest=bytes.fromhex(data['tail_digest']),
+            keyframes=[Keyframe(*keyframe) for keyframe in data['keyframes']],
+        )
+        reader = open_event_reader(cast_path)
+    except (OSError, ValueError, EOFError, KeyError, TypeError):
+        return None
+    if (
+        index.interval != interval
+        or index.header_line != reader.header_line
+        or reader.end() < index.offset
+        or reader.tail_digest(index.offset) != index.tail_digest
+    ):
+        return None
+    return index
+
+def save_index(cast_path: str, index: KeyframeIndex):
+    data = json.dumps({
+        'version': INDEX_VERSION,
+        'interval': index.interval,
+        'header_line': index.header_line.decode('utf-8', 'surrogateescape'),
+        'offset': index.offset,
+        'tail_digest': index.tail_digest.hex(),
+        'keyframes': index.keyframes,
+    }, separators=(',', ':')).encode()
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # A fixed modification time makes the file depend on the index alone
+    checkpoint.write_atomic(index_path(cast_path), gzip.compress(data, mtime=0))
+
+def build_index(cast_path: str, interval: float = DEFAULT_INTERVAL) -> KeyframeIndex:
+    """Index a cast, extending its existing index if possible, and save it if possible"""
+    index = load_index(cast_path, interval)
+    reader = open_event_reader(cast_path)
+    if index is not None and index.offset == reader.end():
+        return index
+
+    keyframes = []
+    screen = pyte.Screen(reader.header.width, reader.header.height)
+    if index is not None and index.keyframes:
+        # Events following the last keyframe are emulated again
+        keyframes = index.keyframes
+        screen = decode_screen(keyframes[-1].screen)
+        reader.offset = keyframes[-1].offset
+    stream = pyte.Stream(screen)
+
+    next_time = keyframes[-1].time + interval if keyframes else interval
+    events = iter(reader)
+    while True:
+        offset = reader.offset
+        event = next(events, None)
+        if event is None:
+            break
+        if event.time >= next_time and checkpoint.between_sequences(stream):
+            keyframes.append(Keyframe(event.time, offset, encode_screen(screen)))
+            next_time = event.time + interval
+        if event.event_type == 'o':
+            stream.feed(event.event_data)
+
+    index = KeyframeIndex(
+        interval=interval,
+        header_line=reader.header_line,
+        offset=reader.offset,
+        tail_digest=reader.tail_digest(reader.offset),
+        keyframes=keyframes,
+    )
+    try:
+        save_index(cast_path, index)
+    except OSError:
+        # The index is only an optimization, e.g. the cache may be read-only
+        pass
+    return index
+
+def encode_screen(screen: pyte.Screen) -> dict:
+    """Return the state of a screen as JSON serializable values
+
+    Characters are stored once in a table and referred to by their position
+    in it.
+    """
+    chars = {}
+
+    def char(value: Char) -> int:
+        return chars.setdefault(tuple(value), len(chars))
+
+    def cursor(value: Cursor) -> list:
+        return [value.x, value.y, value.hidden, char(value.attrs)]
+
+    state = {
+        'columns': screen.columns,
+        'lines': screen.lines,
+        # Empty lines are kept since pyte behaves differently for missing lines
+        'buffer': [
+            [row, [item for column, value in line.items() for item in (column, char(value))]]
+            for row, line in screen.buffer.items()
+        ],
+        'margins': screen.margins and list(screen.margins),
+        'mode': sorted(screen.mode),
+        'title': screen.title,
+        'icon_name': screen.icon_name,
+        'charset': screen.charset,
+        'g0_charset': screen.g0_charset,
+        'g1_charset': screen.g1_charset,
+        'tabstops': sorted(screen.tabstops),
+        'cursor': cursor(screen.cursor),
+        'savepoints': [
+            [cursor(savepoint.cursor)] + list(savepoint[1:]) for savepoint in screen.savepoints
+        ],
+        'saved_columns': screen.saved_columns,
+    }
+    state['chars'] = list(chars)
+    return state
+
+def decode_screen(state: dict) -> pyte.Screen:
+    """Return the screen encoded by encode_screen()"""
+    chars = [Char(*value) for value in state['chars']]
+
+    def cursor(value: list) -> Cursor:
+        x, y, hidden, attrs = value
+        result = Cursor(x, y, chars[attrs])
+        result.hidden = hidden
+        return result
+
+    screen = pyte.Screen(state['columns'], state['lines'])
+    for row, items in state['buffer']:
+        line = screen.buffer[row]
+        for column, value in zip(items[::2], items[1::2]):
+            line[column] = chars[value]
+    screen.margins = state['margins'] and Margins(*state['margins'])
+    screen.mode = set(state['mode'])
+    screen.title = state['title']
+    screen.icon_name = state['icon_name']
+    screen.charset = state['charset']
+    screen.g0_charset = state['g0_charset']
+    screen.g1_charset = state['g1_charset']
+    screen.tabstops = set(state['tabstops'])
+    screen.cursor = cursor(state['cursor'])
+    screen.savepoints = [
+        Savepoint(cursor(savepoint[0]), *savepoint[1:]) for savepoint in state['savepoints']
+    ]
+    screen.saved_columns = state['saved_columns']
+    return screen
+
+def read_window(cast_path: str, start: float = 0, end: float = None,
+                interval: float = DEFAULT_INTERVAL
+                ) -> Tuple[AsciiCastV2Header, pyte.Screen, Iterator[AsciiCastV2Event]]:
+    """Return the header of a cast, its screen at start and the events up to end
+
+    Times of the events are relative to start. The screen is restored from
+    the last keyframe before start, building the index if needed, and the
+    events between the keyframe and start are fed to it.
+    """
+    reader = open_event_reader(cast_path)
+    screen = pyte.Screen(reader.header.width, reader.header.height)
+    if start > 0:
+        keyframes = build_index(cast_path, interval).keyframes
+        previous = [keyframe for keyframe in keyframes if keyframe.time <= start]
+        if previous:
+            screen = decode_screen(previous[-1].screen)
+            reader.offset = previous[-1].offset
+
+    stream = pyte.Stream(screen)
+    events = iter(reader)
+    first_event = None
+    for event in events:
+        if event.time >= start:
+            first_event = event
+            break
+        if event.event_type == 'o':
+            stream.feed(event.event_data)
+    # Every row of the first frame is converted
+    screen.dirty.update(range(screen.lines))
+
+    def window():
+        if first_event is None:
+            return
+        for event in _chain(first_event, events):
+            if end is not None and event.time > end:
+                break
+            yield event._replace(time=event.time - start)
+
+    return reader.header, screen, window()
+
+def _chain(first, rest):
+    yield first
+    yield from rest
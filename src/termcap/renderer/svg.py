@@ -1,4 +1,6 @@
 """SVG generation logic"""
+import copy
+import functools
 import io
 import os
 from lxml import etree
@@ -12,6 +14,11 @@ TERMCAP_NS = 'https://github.com/rexwzh/termcap'
 TERMTOSVG_NS = 'https://github.com/nbedos/termtosvg'
 XLINK_NS = 'http://www.w3.org/1999/xlink'
 
+# Declared by the root element of every template
+_XLINK_DECLARATION = f' xmlns:xlink="{XLINK_NS}"'.encode()
+_SCREEN_CONTENT_MARKER = 'termcap-screen-content'
+_BASE62_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
 class TemplateError(Exception):
     pass
 
@@ -54,22 +61,24 @@ def make_rect_tag(column, length, height, cell_width, cell_height, background_co
         attributes['class'] = background_color
     return etree.Element('rect', attributes)
 
-def make_text_tag(column, attributes, text, cell_width):
+def make_text_tag(column, attributes, text, cell_width, style_table=None):
     text_tag_attributes = {
         'x': str(column * cell_width),
         'textLength': str(wcswidth(text) * cell_width),
     }
+    if style_table is not None:
+        text_tag_attributes['class'] = style_table.text_class(attributes)
+        text_tag = etree.Element('text', text_tag_attributes)
+        text_tag.text = text
+        return text_tag
+
     if attributes['bold']:
         text_tag_attributes['font-weight'] = 'bold'
 
     if attributes['italics']:
         text_tag_attributes['font-style'] = 'italic'
 
-    decoration = ''
-    if attributes['underscore']:
-        decoration = 'underline'
-    if attributes['strikethrough']:
-        decoration += ' line-through'
+    decoration = _text_decoration(attributes)
     if decoration:
         text_tag_attributes['text-decoration'] = decoration
 
@@ -82,57 +91,248 @@ def make_text_tag(column, attributes, text, cell_width):
     text_tag.text = text
     return text_tag
 
-def render_line(y_offset, row_number, line_data, cell_width, cell_height, definitions):
-    """Render a single line of terminal output"""
-    tags = []
-    
-    # Background
-    non_default_bg_cells = [(column, cell) for (column, cell)
-                            in sorted(line_data.items())
+def _text_decoration(attributes):
+    decoration = ''
+    if attributes['underscore']:
+        decoration = 'underline'
+    if attributes['strikethrough']:
+        decoration += ' line-through'
+    return decoration
+
+def base62(number: int) -> str:
+    """Return a short representation of a non negative integer"""
+    digits = ''
+    while True:
+        number, digit = divmod(number, 62)
+        digits = _BASE62_DIGITS[digit] + digits
+        if not number:
+            return digits
+
+class StyleTable:
+    """Table of CSS classes generated for the styles of a compact rendering
+
+    Each distinct combination of text attributes and each background color
+    that is not a class of the template gets a short class, so that elements
+    carry a single class attribute instead of presentation attributes. Colors
+    of the palette of the template keep their class, which is combined with
+    the generated one if the text has other attributes.
+    """
+    def __init__(self):
+        self._classes = {}
+
+    def text_class(self, attributes) -> str:
+        color = attributes['color']
+        palette_color = None if color.startswith('#') else color
+        declarations = []
+        if palette_color is None:
+            declarations.append(f'fill:{color}')
+        if attributes['bold']:
+            declarations.append('font-weight:bold')
+        if attributes['italics']:
+            declarations.append('font-style:italic')
+        decoration = _text_decoration(attributes)
+        if decoration:
+            declarations.append(f'text-decoration:{decoration}')
+
+        if not declarations:
+            return palette_color
+        generated_class = self._class(';'.join(declarations))
+        if palette_color is None:
+            return generated_class
+        return f'{palette_color} {generated_class}'
+
+    def background_class(self, color) -> str:
+        if not color.startswith('#'):
+            return color
+        return self._class(f'fill:{color}')
+
+    def css(self) -> str:
+        """Return the rules of the generated classes"""
+        return ''.join(
+            f'.{class_name}{{{declarations}}}'
+            for declarations, class_name in self._classes.items()
+        )
+
+    def _class(self, declarations):
+        class_name = self._classes.get(declarations)
+        if class_name is None:
+            class_name = 's' + base62(len(self._classes))
+            self._classes[declarations] = class_name
+        return class_name
+
+class LineCache:
+    """Memo of rendered lines keyed by the content of their cells
+
+    A line already seen is rendered from the memo with a dict lookup instead of
+    building and serializing its text group, which is the common case for
+    prompts, static TUI chrome and scrolled lines. Only the ids of the
+    definitions are kept, the definitions themselves are returned once by
+    lookup() and are up to the caller. A cache must only be used with a
+    single cell width.
+
+    A compact cache renders styles with the classes of its style_table and
+    uses short ids for definitions.
+    """
+    def __init__(self, compact: bool = False):
+        self.hits = 0
+        self.misses = 0
+        self.style_table = StyleTable() if compact else None
+        self._lines = {}
+        self._group_ids = {}
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(self, line_data, cell_width):
+        """Return the rendering of a line and the definitions it adds
+
+        The rendering is a hashable (group_id, background_runs) pair, equal for
+        lines that render the same.
+        """
+        key = tuple(sorted(line_data.items()))
+        rendered_line = self.get(key)
+        if rendered_line is not None:
+            return rendered_line, {}
+        return self.add(key, *line_runs(line_data), cell_width)
+
+    def get(self, key):
+        """Return the rendering of the line identified by ``key``, or None"""
+        rendered_line = self._lines.get(key)
+        if rendered_line is not None:
+            self.hits += 1
+        return rendered_line
+
+    def add(self, key, text_runs, background_runs, cell_width):
+        """Render a line missing from the cache from the runs of line_runs()
+
+        Return the rendering of the line and the definitions it adds.
+        """
+        self.misses += 1
+        new_definitions = {}
+        text_group_tag, text_group_tag_str = _text_group(text_runs, cell_width, self.style_table)
+        group_id = self._group_ids.get(text_group_tag_str)
+        if group_id is None:
+            if self.style_table is None:
+                group_id = 'g{}'.format(len(self._group_ids) + 1)
+            else:
+                group_id = 'g' + base62(len(self._group_ids))
+            text_group_tag.attrib['id'] = group_id
+            self._group_ids[text_group_tag_str] = group_id
+            new_definitions = {text_group_tag_str: text_group_tag}
+        if self.style_table is not None:
+            background_runs = [
+                (column, length, self.style_table.background_class(color))
+                for column, length, color in background_runs
+            ]
+        rendered_line = group_id, tuple(background_runs)
+        self._lines[key] = rendered_line
+        return rendered_line, new_definitions
+
+    def render_line(self, y_offset, row_number, line_data, cell_width, cell_height):
+        """Render a single line of terminal output
+
+        Return its tags and the definitions it adds, see lookup().
+        """
+        (group_id, background_runs), new_definitions = self.lookup(line_data, cell_width)
+        tags = line_tags(
+            y_offset, row_number, group_id, background_runs, cell_width, cell_height
+        )
+        return tags, new_definitions
+
+    def state(self, encode_key) -> dict:
+        """Return the content of the cache as JSON serializable values
+
+        Keys of lines are encoded by ``encode_key``.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'classes': None if self.style_table is None else self.style_table._classes,
+            'lines': [[encode_key(key), rendered_line] for key, rendered_line in self._lines.items()],
+            'group_ids': [[tag.decode(), group_id] for tag, group_id in self._group_ids.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, decode_key) -> 'LineCache':
+        """Return the cache saved by state(), keys being decoded by ``decode_key``"""
+        line_cache = cls(state['classes'] is not None)
+        line_cache.hits = state['hits']
+        line_cache.misses = state['misses']
+        if line_cache.style_table is not None:
+            line_cache.style_table._classes = dict(state['classes'])
+        line_cache._lines = {
+            decode_key(key): decode_rendered_line(rendered_line)
+            for key, rendered_line in state['lines']
+        }
+        line_cache._group_ids = {tag.encode(): group_id for tag, group_id in state['group_ids']}
+        return line_cache
+
+def decode_rendered_line(value) -> Tuple[str, tuple]:
+    """Return the rendered line of LineCache decoded from its JSON value"""
+    group_id, background_runs = value
+    return group_id, tuple(tuple(run) for run in background_runs)
+
+def line_runs(line_data):
+    """Split a line into runs of cells rendered by a single tag
+
+    Return a list of (column, attributes, text) for <text> tags and a list of
+    (column, length, color) for the rects of non default backgrounds.
+    """
+    line_items = sorted(line_data.items())
+
+    text_runs = []
+    key = ConsecutiveWithSameAttributes(['color', 'bold', 'italics', 'underscore', 'strikethrough'])
+    for (column, attributes), group in groupby(line_items, key):
+        text = ''.join(c.text for _, c in group)
+        text_runs.append((column, attributes, text))
+
+    non_default_bg_cells = [(column, cell) for (column, cell) in line_items
                             if cell.background_color != 'background']
 
+    background_runs = []
     key = ConsecutiveWithSameAttributes(['background_color'])
     for (column, attributes), group in groupby(non_default_bg_cells, key):
         length = wcswidth(''.join(t[1].text for t in group))
-        tags.append(make_rect_tag(
-            column,
-            length,
-            y_offset + row_number * cell_height,
-            cell_width,
-            cell_height,
-            attributes['background_color']
-        ))
-
-    # Text
+        background_runs.append((column, length, attributes['background_color']))
+
+    return text_runs, background_runs
+
+def _text_group(text_runs, cell_width, style_table=None):
+    """Return the text group of a line, without id, and its serialization"""
     text_group_tag = etree.Element('g')
-    line_items = sorted(line_data.items())
-    key = ConsecutiveWithSameAttributes(['color', 'bold', 'italics', 'underscore', 'strikethrough'])
-    
-    for (column, attributes), group in groupby(line_items, key):
-        text = ''.join(c.text for _, c in group)
-        text_group_tag.append(make_text_tag(column, attributes, text, cell_width))
-
-    # Reuse definition if possible
-    text_group_tag_str = etree.tostring(text_group_tag)
-    new_definitions = {}
-    
-    if text_group_tag_str in definitions:
-        group_id = definitions[text_group_tag_str].attrib['id']
-    else:
-        group_id = 'g{}'.format(len(definitions) + 1)
-        text_group_tag.attrib['id'] = group_id
-        new_definitions = {text_group_tag_str: text_group_tag}
+    for column, attributes, text in text_runs:
+        text_group_tag.append(make_text_tag(column, attributes, text, cell_width, style_table))
+
+    return text_group_tag, etree.tostring(text_group_tag)
+
+def line_tags(y_offset, row_number, group_id, background_runs, cell_width, cell_height):
+    """Return the background rects and the <use> tag of a rendered line"""
+    height = y_offset + row_number * cell_height
+    tags = [
+        make_rect_tag(column, length, height, cell_width, cell_height, color)
+        for column, length, color in background_runs
+    ]
 
     use_attributes = {
         f'{{{XLINK_NS}}}href': f'#{group_id}',
-        'y': str(y_offset + row_number * cell_height),
+        'y': str(height),
     }
     tags.append(etree.Element('use', use_attributes))
-
-    return tags, new_definitions
+    return tags
 
 def resize_template(template_content: bytes, columns: int, rows: int, cell_width: int, cell_height: int) -> etree.Element:
-    """Resize template based on the number of rows and columns of the terminal"""
+    """Resize template based on the number of rows and columns of the terminal
+
+    Parsed and resized templates are cached by content and geometry, the
+    caller gets a copy it can modify.
+    """
+    return copy.deepcopy(_resized_template(template_content, columns, rows, cell_width, cell_height))
+
+@functools.lru_cache(maxsize=32)
+def _resized_template(template_content: bytes, columns: int, rows: int, cell_width: int,
+                      cell_height: int) -> etree.Element:
     try:
         tree = etree.parse(io.BytesIO(template_content))
         root = tree.getroot()
@@ -170,7 +370,17 @@ def resize_template(template_content: bytes, columns: int, rows: int, cell_width
         raise TemplateError('svg element with id "screen" not found')
     _scale_element(screen, template_columns, template_rows, columns, rows, cell_width, cell_height)
 
-    return root
+    return _declare_xlink(root)
+
+def _declare_xlink(root):
+    """Make sure the root element declares the xlink namespace used by <use> tags"""
+    if 'xlink' in root.nsmap:
+        return root
+
+    new_root = etree.Element(root.tag, dict(root.attrib), nsmap={**root.nsmap, 'xlink': XLINK_NS})
+    new_root.text = root.text
+    new_root.extend(root)
+    return new_root
 
 def _scale_element(element, template_columns, template_rows, columns, rows, cell_width, cell_height):
     if 'viewBox' in element.attrib:
@@ -188,16 +398,7 @@ def _scale_element(element, template_columns, template_rows, columns, rows, cell
             except ValueError:
                 pass
 
-def embed_css(root, timings, animation_duration):
-    try:
-        style = root.find(f'.//{{{SVG_NS}}}defs/{{{SVG_NS}}}style[@id="generated-style"]')
-    except etree.Error as exc:
-        raise TemplateError('Invalid template') from exc
-
-    if style is None:
-        raise TemplateError('Missing <style id="generated-style" ...> element')
-
-    css_body = """#screen {
+_CSS_BODY = """#screen {
                 font-family: 'DejaVu Sans Mono', monospace;
                 font-style: normal;
                 font-size: 14px;
@@ -209,6 +410,22 @@ def embed_css(root, timings, animation_duration):
         }
     """
 
+def _generated_style(root):
+    try:
+        style = root.find(f'.//{{{SVG_NS}}}defs/{{{SVG_NS}}}style[@id="generated-style"]')
+    except etree.Error as exc:
+        raise TemplateError('Invalid template') from exc
+
+    if style is None:
+        raise TemplateError('Missing <style id="generated-style" ...> element')
+    return style
+
+def embed_css(root, timings, animation_duration, style_table=None):
+    style = _generated_style(root)
+    css_body = _CSS_BODY
+    if style_table is not None:
+        css_body += style_table.css()
+
     if animation_duration is None or timings is None:
         style.text = etree.CDATA(css_body)
     else:
@@ -255,3 +472,96 @@ def embed_css(root, timings, animation_duration):
 
         style.text = etree.CDATA(css_body + css_animation)
     return root
+
+def embed_visibility_css(root, lifetimes, animation_duration, style_table=None):
+    """Embed the CSS animating the rows written by row lifetime rendering
+
+    lifetimes maps the id of each child of #screen_view to the list of
+    (start, end) intervals of time during which it is visible. Children are
+    hidden outside of these intervals. The iteration count is set on
+    #screen_view and inherited by its children so that templates overriding
+    it still apply.
+    """
+    if animation_duration == 0:
+        raise ValueError('Animation duration must be greater than 0')
+
+    style = _generated_style(root)
+    keyframe_format = "{time:.3f}%{{visibility:{visibility}}}"
+    rules = []
+    for element_id, intervals in lifetimes.items():
+        keyframes = []
+        for start, end in intervals:
+            keyframes.append(
+                keyframe_format.format(time=100.0 * start/animation_duration, visibility='visible')
+            )
+            # The last keyframe holds until the end of the animation
+            keyframes.append(
+                keyframe_format.format(
+                    time=100.0 * end/animation_duration,
+                    visibility='hidden' if end < animation_duration else 'visible'
+                )
+            )
+        rules.append(
+            "@keyframes {id}{{{keyframes}}}#{id}{{animation-name:{id}}}".format(
+                id=element_id,
+                keyframes=''.join(keyframes)
+            )
+        )
+
+    css_animation = """
+            :root {{
+                --animation-duration: {duration}ms;
+            }}
+
+            #screen_view {{
+                animation-iteration-count:infinite;
+            }}
+
+            #screen_view > * {{
+                visibility: hidden;
+                animation-duration: {duration}ms;
+                animation-iteration-count: inherit;
+                animation-timing-function: steps(1,end);
+                animation-fill-mode: forwards;
+            }}
+
+            {rules}
+        """.format(
+        duration=animation_duration,
+        rules=os.linesep.join(rules)
+    )
+
+    css_body = _CSS_BODY
+    if style_table is not None:
+        css_body += style_table.css()
+    style.text = etree.CDATA(css_body + css_animation)
+    return root
+
+def split_template(root) -> Tuple[bytes, bytes]:
+    """Serialize the template around the end of the content of svg#screen
+
+    Return the bytes before and after the position of the last child of the
+    screen, so that more content can be written in between without keeping it
+    in the tree.
+    """
+    screen = root.find(f'.//{{{SVG_NS}}}svg[@id="screen"]')
+    if screen is None:
+        raise TemplateError('svg element with id "screen" not found')
+
+    marker = etree.Comment(_SCREEN_CONTENT_MARKER)
+    screen.append(marker)
+    try:
+        head, tail = etree.tostring(root).split(etree.tostring(marker))
+    finally:
+        screen.remove(marker)
+    return head, tail
+
+def serialize(element) -> bytes:
+    """Serialize an element of the screen as it appears inside the template
+
+    The element must declare the xlink namespace with the "xlink" prefix if it
+    uses it. The declaration is dropped since the template root provides it.
+    """
+    data = etree.tostring(element)
+    start_tag_end = data.index(b'>')
+    return data[:start_tag_end].replace(_XLINK_DECLARATION, b'') + data[start_tag_end:]
@@ -7,3 +7,54 @@ def test_config():
     manager = get_config_manager()
     config = manager.load_config()
     assert config
+
+def test_cli_startup(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    env = dict(os.environ, HOME=str(tmp_path), XDG_CONFIG_HOME=str(tmp_path / "config"),
+               XDG_CACHE_HOME=str(tmp_path / "cache"), XDG_DATA_HOME=str(tmp_path / "data"))
+    script = (
+        "import sys\n"
+        "from termcap.cli import main\n"
+        "try:\n"
+        "    main(sys.argv[1:])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(name for name in ('lxml', 'pyte', 'rich') if name in sys.modules))\n"
+    )
+    for args, modules in ((["--version"], "[]"), (["replay", "--help"], "[]"),
+                          (["config", "show"], "[]"), (["render", "--help"], "['lxml', 'pyte', 'rich']")):
+        result = subprocess.run([sys.executable, "-c", script, *args], env=env,
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.splitlines()[-1] == modules
+
+    # Commands only reading the configuration write nothing
+    assert list(tmp_path.iterdir()) == []
+
+def test_render_rejects_animation_options(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from termcap.cli import main
+
+    for name in ("HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_DATA_HOME"):
+        monkeypatch.setenv(name, str(tmp_path / name))
+    cast_path = tmp_path / "test.cast"
+    cast_path.write_text('{"version": 2, "width": 80, "height": 24}\n')
+    for option in ("--row-lifetimes", "--array-frames", "--compact", "--sidecar=gz", "--checkpoint"):
+        result = CliRunner().invoke(main, ["render", str(cast_path), "--still-frames", option])
+        assert result.exit_code == 2
+        assert f"{option.split('=')[0]} cannot be used with --still-frames" in result.output
+
+def test_render_rejects_mislabeled_compression(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from termcap.cli import main
+
+    for name in ("HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_DATA_HOME"):
+        monkeypatch.setenv(name, str(tmp_path / name))
+    cast_path = tmp_path / "test.cast"
+    cast_path.write_text('{"version": 2, "width": 80, "height": 24}\n')
+    for arguments in (["-z", str(tmp_path / "out.svg")], ["--sidecar=gz", str(tmp_path / "out.svgz")]):
+        result = CliRunner().invoke(main, ["render", str(cast_path), *arguments])
+        assert result.exit_code == 1
+    assert list(tmp_path.glob("out.*")) == []
@@ -37,7 +37,8 @@ def test_load_default_config(mock_config_paths):
     config = manager.load_config()
     
     assert config == DEFAULT_CONFIG
-    assert mock_file.return_value.exists()
+    # Reading the configuration does not write it
+    assert not mock_file.return_value.exists()
 
 def test_load_existing_config(mock_config_paths):
     mock_file, _ = mock_config_paths
@@ -90,3 +91,20 @@ def test_available_templates(mock_config_paths):
     assert "my_custom" in templates
     assert templates["gjm8"] is None  # Builtin
     assert templates["my_custom"] == mock_dir.return_value / "my_custom.svg"  # Custom
+
+def test_template_cache(mock_config_paths):
+    _, mock_dir = mock_config_paths
+    manager = ConfigManager()
+    assert "my_custom" not in manager.get_available_templates()
+
+    mock_dir.return_value.mkdir(parents=True)
+    template_path = mock_dir.return_value / "my_custom.svg"
+    template_path.write_bytes(b"<svg/>")
+    assert manager.get_template_content("my_custom") == b"<svg/>"
+    assert manager.get_template_content("gjm8") is manager.get_template_content("gjm8")
+
+    template_path.write_bytes(b"<svg></svg>")
+    assert manager.get_template_content("my_custom") == b"<svg></svg>"
+
+    manager.remove_custom_template("my_custom")
+    assert manager.get_template_content("my_custom") is None
@@ -1,8 +1,12 @@
 import pytest
+import gzip
 import json
-from io import StringIO
+from io import BytesIO, StringIO
 from unittest.mock import patch
-from termcap.parser.asciicast import read_records, AsciiCastV2Header, AsciiCastV2Event
+from termcap.parser import asciicast
+from termcap.parser.asciicast import read_records, AsciiCastV2Header, AsciiCastV2Event, EventReader, ReadStats
+from termcap.parser import formats, tcap
+from termcap.parser.store import EventStore
 
 def test_header_parsing():
     json_data = json.dumps({
@@ -29,7 +33,7 @@ def test_event_parsing():
     
     file_content = f"{header_json}\n{event1_json}\n{event2_json}"
     
-    with patch('builtins.open', return_value=StringIO(file_content)):
+    with patch('builtins.open', return_value=BytesIO(file_content.encode())):
         records = read_records("dummy.cast")
         next(records)  # Skip header
         
@@ -66,3 +70,146 @@ def test_event_to_json():
     json_str = event.to_json_line()
     data = json.loads(json_str)
     assert data == [1.5, "o", "test"]
+
+def test_event_reader_offsets(tmp_path):
+    path = tmp_path / "growing.cast"
+    header_line = b'{"version": 2, "width": 80, "height": 24}\n'
+    event_line = b'[1.0, "o", "hello"]\n'
+    path.write_bytes(header_line + event_line + b'[2.0, "o", "wor')
+
+    reader = EventReader(str(path))
+    assert reader.header.width == 80
+    assert [event.event_data for event in reader] == ["hello"]
+    # The incomplete last line is left for a later read
+    assert reader.offset == len(header_line) + len(event_line)
+
+    with open(path, 'ab') as f:
+        f.write(b'ld"]\n')
+    assert [event.event_data for event in reader] == ["world"]
+
+def test_read_records_batches(tmp_path):
+    path = tmp_path / "malformed.cast"
+    lines = [json.dumps({"version": 2, "width": 80, "height": 24})]
+    lines += [json.dumps([0.1 * i, "o", f"line {i}"]) for i in range(20)]
+    lines[5] = '{"broken'
+    lines[9] = ''
+    lines[12] = '[1.0, "o"]'
+    lines[15] = '[1.5, "o", "\\ud800"]'
+    path.write_text('\n'.join(lines))
+
+    stats = ReadStats()
+    with patch.object(asciicast, '_BATCH_SIZE', 64):
+        records = list(read_records(str(path), stats))
+
+    expected = [json.loads(line) for line in lines[1:] if line and line not in (lines[5], lines[12])]
+    assert [list(record[:3]) for record in records[1:]] == expected
+    assert stats.events == len(expected)
+    assert stats.malformed_lines == 2
+    assert stats.malformed_line_numbers == [6, 13]
+
+def test_read_records_several_events_on_a_line(tmp_path):
+    path = tmp_path / "joined.cast"
+    path.write_text(
+        json.dumps({"version": 2, "width": 80, "height": 24}) + '\n'
+        '[0.0, "o", "a"]\n'
+        '[0.1, "o", "b"], [0.2, "o", "c"]\n'
+        '[0.3, "o", "d"]\n'
+    )
+
+    stats = ReadStats()
+    records = list(read_records(str(path), stats))
+    assert [record.event_data for record in records[1:]] == ["a", "d"]
+    assert stats.malformed_line_numbers == [3]
+
+def test_event_store():
+    events = [AsciiCastV2Event(0.5 * i, "i" if i % 4 == 3 else "o", f"é{i}") for i in range(10)]
+    store = EventStore.from_events(events)
+
+    assert len(store) == 10
+    assert list(store) == events
+    assert store[-1] == events[-1]
+    # Time, type code and end offset of each event, the start offset and the text
+    assert store.nbytes() == 10 * (8 + 1 + 8) + 8 + len("".join(event.event_data for event in events).encode())
+
+    window = store[2:8]
+    assert list(window) == events[2:8]
+    assert list(window[1:3]) == events[3:5]
+    assert window.bisect(2.0) == 2 and window.bisect(100) == len(window)
+    assert bytes(window.data_view(0)) == "é2".encode()
+    assert window.joined_data(0, 4) == "é2é4é5"
+    assert window.joined_data(0, 4, "i") == "é3"
+    assert window.type_code("x") is None
+
+@pytest.mark.parametrize("codec", tcap.CODECS)
+def test_tcap_round_trip(tmp_path, codec):
+    header_line = b'{"version": 2, "width": 80, "height": 24}\n'
+    events = [AsciiCastV2Event(0.25 * i, "i" if i % 5 == 4 else "o", f"\x1b[1mé{i}\ud800") for i in range(100)]
+    path = tmp_path / "test.tcap"
+
+    with patch.object(tcap, "CHUNK_EVENTS", 16):
+        assert tcap.write_tcap(str(path), header_line, events, codec) == 100
+    assert tcap.is_tcap(str(path))
+
+    reader = tcap.TcapReader(str(path))
+    assert len(reader) == 100 and len(reader.chunks) == 7
+    assert reader.header.width == 80
+    assert list(reader.events(40)) == events[40:]
+    assert reader.chunk_at_time(5.0) == 1
+    assert list(reader.events_between(5.0, 10.0)) == events[20:41]
+
+    stats = ReadStats()
+    records = list(formats.read_records(str(path), stats))
+    assert records[0].height == 24 and records[1:] == events
+    assert stats.events == 100
+    header, store = formats.read_event_store(str(path))
+    assert header.width == 80 and list(store) == events
+
+    event_reader = formats.open_event_reader(str(path))
+    event_reader.offset = 98
+    assert list(event_reader) == events[98:]
+    assert event_reader.offset == event_reader.end() == 100
+
+def test_tcap_chunk_bytes(tmp_path):
+    header_line = b'{"version": 2, "width": 80, "height": 24}\n'
+    # 10 characters, 20 bytes of UTF-8
+    events = [AsciiCastV2Event(0.25 * i, "o", "é" * 10) for i in range(8)]
+    path = tmp_path / "test.tcap"
+
+    with patch.object(tcap, "CHUNK_BYTES", 40):
+        tcap.write_tcap(str(path), header_line, events)
+    assert [chunk.events for chunk in tcap.TcapReader(str(path)).chunks] == [2, 2, 2, 2]
+
+    # Casts in any other format are read as asciicast
+    cast_path = tmp_path / "test.cast"
+    cast_path.write_bytes(header_line + b'[0.5, "o", "TCAP"]\n')
+    assert not formats.is_tcap(str(cast_path))
+    assert list(formats.open_event_reader(str(cast_path))) == [AsciiCastV2Event(0.5, "o", "TCAP")]
+
+    # The chunks of compressed .tcap files could not be read in place
+    compressed_path = tmp_path / "test.tcap.gz"
+    compressed_path.write_bytes(gzip.compress(path.read_bytes()))
+    with pytest.raises(ValueError, match="Compressed .tcap"):
+        next(formats.read_records(str(compressed_path)))
+
+@pytest.mark.parametrize("suffix", [".gz", ".xz"])
+def test_compressed_casts(tmp_path, suffix):
+    header = AsciiCastV2Header(2, 80, 24)
+    events = [AsciiCastV2Event(0.5 * i, "o", f"é{i}\r\n") for i in range(1000)]
+    path = str(tmp_path / f"test.cast{suffix}")
+    with asciicast.open_cast_output(path) as cast_file:
+        cast_file.writelines(line + "\n" for line in [header.to_json_line()] + [e.to_json_line() for e in events])
+
+    with patch.object(asciicast, "_BATCH_SIZE", 100):
+        assert list(read_records(path)) == [header] + events
+    reader = EventReader(path)
+    assert list(reader) == events
+    assert reader.offset == reader.end()
+
+    # A cast still being recorded is read up to its last complete line
+    truncated_path = tmp_path / f"truncated.cast{suffix}"
+    data = (tmp_path / f"test.cast{suffix}").read_bytes()
+    truncated_path.write_bytes(data[:len(data) // 2])
+    stats = ReadStats()
+    records = list(read_records(str(truncated_path), stats))
+    assert 1 < len(records) < 1001 and records[1:] == events[:len(records) - 1]
+    assert stats.malformed_lines == 0
@@ -1,7 +1,11 @@
+import json
+import os
 import pytest
 import termios
+from io import StringIO
 from unittest.mock import patch, MagicMock
-from termcap.recorder import core, terminal
+from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header
+from termcap.recorder import core, terminal, writer
 
 def test_get_terminal_size():
     # Mock fcntl.ioctl
@@ -53,3 +57,63 @@ def test_record_session_header():
         assert header.width == 80
         assert header.height == 24
         assert header.version == 2
+
+def test_record_session_output(tmp_path):
+    # Output of the child is recorded and copied to the output file
+    # descriptor in full, including what is left in the PTY when it exits
+    input_fd, input_write_fd = os.pipe()
+    output_path = tmp_path / "output"
+    output_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT)
+    ticks = []
+    try:
+        records = list(core.record_session(
+            ["sh", "-c", "head -c 300000 /dev/zero | tr '\\0' a; sleep 0.3; printf é"], 80, 24, input_fd, output_fd,
+            tick=lambda: ticks.append(1), tick_interval=0.05,
+        ))
+    finally:
+        for fd in (input_fd, input_write_fd, output_fd):
+            os.close(fd)
+
+    recorded = "".join(event.event_data for event in records[1:])
+    assert recorded == "a" * 300000 + "é"
+    assert output_path.read_bytes() == recorded.encode()
+    # Ticks go on while the child is idle
+    assert len(ticks) >= 3
+
+def test_cast_writer_coalesces_events():
+    cast_file = StringIO()
+    with writer.CastWriter(cast_file, coalesce_window=0.005, time_precision=3) as cast_writer:
+        cast_writer.write_header(AsciiCastV2Header(2, 80, 24))
+        for time, event_type, data in [
+            (0.1234567, "o", "a"), (0.125, "o", "b"), (0.1284, "o", "é"),
+            (0.129, "i", "x"), (0.2, "o", "c"), (0.2049, "o", "d"), (0.21, "o", "e"),
+        ]:
+            cast_writer.write_event(AsciiCastV2Event(time, event_type, data))
+        # Events are buffered until the writer is flushed or closed
+        assert cast_file.getvalue() == ""
+
+    lines = cast_file.getvalue().splitlines()
+    assert json.loads(lines[0])["width"] == 80
+    assert lines[1:] == ['[0.123,"o","abé"]', '[0.129,"i","x"]', '[0.2,"o","cd"]', '[0.21,"o","e"]']
+    assert cast_writer.events == 4
+
+def test_cast_writer_flushes_full_buffer():
+    cast_file = StringIO()
+    cast_writer = writer.CastWriter(cast_file, coalesce_window=0, buffer_size=20)
+    for i in range(2):
+        cast_writer.write_event(AsciiCastV2Event(float(i), "o", "0123456789"))
+    assert cast_file.getvalue() == '[0.0,"o","0123456789"]\n'
+    cast_writer.write_event(AsciiCastV2Event(2.0, "o", "0123456789"))
+    cast_writer.close()
+    assert len(cast_file.getvalue().splitlines()) == 3
+
+def test_cast_writer_flushes_when_due():
+    cast_file = StringIO()
+    cast_writer = writer.CastWriter(cast_file, flush_interval=60)
+    cast_writer.write_event(AsciiCastV2Event(0.5, "o", "a"))
+    cast_writer.flush_if_due()
+    assert cast_file.getvalue() == ""
+    # The pending group is written once the interval elapsed
+    cast_writer.flush_interval = 0
+    cast_writer.flush_if_due()
+    assert cast_file.getvalue() == '[0.5,"o","a"]\n'
@@ -1,7 +1,16 @@
+import gzip
+import json
+import os
+import pickle
+import weakref
+
 import pytest
 from unittest.mock import patch, MagicMock
-from termcap.renderer import core, svg, theme
+from termcap.renderer import batch, checkpoint, compression, core, keyframes, svg, theme
+from termcap.renderer.cache import RenderCache, animation_options, cache_key
+from termcap.parser import tcap
 from termcap.parser.asciicast import AsciiCastV2Event, AsciiCastV2Header
+from termcap.parser.store import EventStore
 
 @pytest.fixture
 def mock_template():
@@ -43,6 +52,22 @@ def test_char_to_cell():
     assert cell.background_color == 'background'
     assert cell.bold is True
 
+def test_char_to_cell_interns_cells():
+    import pyte
+    char = pyte.screens.Char('x', fg='green', bg='ff8800', bold=True)
+
+    cell = core._char_to_cell(char)
+    assert cell.color == 'color10'
+    assert cell.background_color == '#ff8800'
+    assert core._char_to_cell(pyte.screens.Char('x', fg='green', bg='ff8800', bold=True)) is cell
+
+    reversed_cell = core._char_to_cell(char._replace(reverse=True))
+    assert reversed_cell.color == '#ff8800'
+    assert reversed_cell.background_color == 'color10'
+
+    with pytest.raises(ValueError, match="Invalid background color"):
+        core._char_to_cell(char._replace(bg='nope'))
+
 def test_group_by_time():
     records = [
         AsciiCastV2Event(0.1, 'o', 'a'),
@@ -60,6 +85,13 @@ def test_group_by_time():
     # Logic verification is complex without stepping through, but we ensure it runs
     assert isinstance(grouped[0], AsciiCastV2Event)
 
+def test_group_event_store_by_time():
+    records = [AsciiCastV2Event(0.3 * i, 'i' if i % 3 == 0 else 'o', f'{i}é') for i in range(1, 20)]
+    store = EventStore.from_events(records)
+
+    for durations in ((1, 1000, 500), (400, None, 0), (1000, 500, 100)):
+        assert list(core._group_by_time(store, *durations)) == list(core._group_by_time(records, *durations))
+
 @patch('termcap.renderer.theme.load_template')
 @patch('builtins.open', new_callable=MagicMock)
 def test_render_animation(mock_open, mock_load, mock_template):
@@ -85,3 +117,459 @@ def test_make_tags():
     assert text.text == "hello"
     assert text.attrib['font-weight'] == "bold"
     assert text.attrib['class'] == "red"
+
+def test_timed_frames_share_unchanged_rows():
+    header = AsciiCastV2Header(2, 20, 5)
+    records = [
+        AsciiCastV2Event(0.0, 'o', 'first line\r\n'),
+        AsciiCastV2Event(0.5, 'o', 'second'),
+        AsciiCastV2Event(1.0, 'o', '\x1b[2J'),
+    ]
+
+    _, frames = core.timed_frames(records, header, 1, None, 1000)
+    frames = list(frames)
+
+    # Row 0 is not touched by the second frame and is shared as is
+    assert frames[1].buffer[0] is frames[0].buffer[0]
+    assert ''.join(c.text for c in frames[1].buffer[1].values()).startswith('second')
+    # Clearing the screen damages every row
+    assert frames[2].buffer[0] is not frames[1].buffer[0]
+    assert ''.join(c.text for c in frames[2].buffer[0].values()).strip() == ''
+
+def test_timed_frames_max_frames():
+    header = AsciiCastV2Header(2, 20, 5)
+    records = [
+        AsciiCastV2Event(0.0, 'o', '\x1b[?25labcdefgh'),
+        AsciiCastV2Event(1.0, 'o', 'i'),
+        AsciiCastV2Event(2.0, 'o', '\x1b[2J\x1b[Hxxxxxxxx'),
+    ]
+
+    _, frames = core.timed_frames(records, header, 1, None, 1000, max_frames=2)
+    frames = list(frames)
+
+    # The frame followed by a single changed cell is merged into its successor
+    assert [(frame.time, frame.duration) for frame in frames] == [(0, 2000), (2000, 1000)]
+    assert ''.join(c.text for c in frames[0].buffer[0].values()) == 'abcdefghi'
+
+    _, frames = core.timed_frames(records, header, 1, None, 1000, max_fps=0.5)
+    assert [(frame.time, frame.duration) for frame in frames] == [(0, 2000), (2000, 1000)]
+
+def test_merge_frames_bounded():
+    class Buffer(dict):
+        pass
+
+    buffers = []
+    held = []
+
+    def frames():
+        for i in range(200):
+            buffer = Buffer({0: {column: 'x' for column in range(i % 7)}})
+            buffers.append(weakref.ref(buffer))
+            held.append(sum(ref() is not None for ref in buffers))
+            yield core.TimedFrame(10 * i, 10, buffer)
+            del buffer
+
+    merged = list(core._merge_frames(frames(), 5))
+    assert len(merged) == 5
+    assert max(held) <= 7
+    assert merged[0].time == 0
+    assert sum(frame.duration for frame in merged) == 2000
+
+def test_line_cache_reuses_rendered_lines():
+    cell = svg.CharacterCell('a', 'color1', 'color2', False, False, False, False)
+    line_cache = svg.LineCache()
+
+    tags, new_defs = line_cache.render_line(0, 0, {0: cell, 1: cell}, 8, 17)
+    assert len(new_defs) == 1
+    assert tags[0].tag == 'rect'
+
+    tags, new_defs = line_cache.render_line(0, 3, {1: cell, 0: cell}, 8, 17)
+    assert new_defs == {}
+    assert tags[-1].attrib['y'] == str(3 * 17)
+    assert line_cache.hits == 1
+    assert line_cache.misses == 1
+    assert line_cache.hit_rate == 0.5
+
+def test_split_template(mock_template):
+    root = svg.resize_template(mock_template, 80, 24, 8, 17)
+    head, tail = svg.split_template(root)
+
+    assert head.endswith(b'<svg id="screen">')
+    assert tail.strip() == b'</svg>\n</svg>'
+    # The tree is left untouched
+    screen = root.find(f'.//{{{svg.SVG_NS}}}svg[@id="screen"]')
+    assert len(screen) == 0
+
+def test_serialize_drops_xlink_declaration():
+    group = svg.etree.Element('g', nsmap={'xlink': svg.XLINK_NS})
+    svg.etree.SubElement(group, 'use', {f'{{{svg.XLINK_NS}}}href': '#g1'})
+    assert svg.serialize(group) == b'<g><use xlink:href="#g1"/></g>'
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_animation_deduplicates_frames(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 2)
+    records = [
+        AsciiCastV2Event(0.0, 'o', '\x1b[?25l|'),
+        AsciiCastV2Event(0.1, 'o', '\x1b[H/'),
+        AsciiCastV2Event(0.2, 'o', '\x1b[H|'),
+        AsciiCastV2Event(0.3, 'o', '\x1b[H/'),
+    ]
+    output_path = tmp_path / "out.svg"
+
+    summary = core.render_animation(records, header, str(output_path), "gjm8")
+
+    assert summary.frames == 4
+    assert summary.unique_frames == 2
+    root = svg.etree.parse(str(output_path)).getroot()
+    screen_view = root.find(f'.//{{{svg.SVG_NS}}}g[@id="screen_view"]')
+    assert len(screen_view) == 2
+    style = root.find(f'.//{{{svg.SVG_NS}}}style[@id="generated-style"]')
+    assert 'translateY(-68px)' in style.text
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_animation_row_lifetimes(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 2)
+    records = [
+        AsciiCastV2Event(0.0, 'o', '\x1b[?25l|\r\nstatic'),
+        AsciiCastV2Event(0.1, 'o', '\x1b[H/'),
+        AsciiCastV2Event(0.2, 'o', '\x1b[H|'),
+    ]
+    output_path = tmp_path / "out.svg"
+
+    summary = core.render_animation(records, header, str(output_path), "gjm8", row_lifetimes=True)
+
+    assert summary.frames == 3
+    assert summary.unique_frames == 2
+    root = svg.etree.parse(str(output_path)).getroot()
+    screen_view = root.find(f'.//{{{svg.SVG_NS}}}g[@id="screen_view"]')
+    # '|' then 'static' in the first frame, '/' in the second one
+    assert [element.get('id') for element in screen_view] == ['r1', 'r2', 'r3']
+    style = root.find(f'.//{{{svg.SVG_NS}}}style[@id="generated-style"]').text
+    assert '@keyframes r1{0.000%{visibility:visible}8.333%{visibility:hidden}' \
+           '16.667%{visibility:visible}100.000%{visibility:visible}}' in style
+    assert '@keyframes r2{0.000%{visibility:visible}100.000%{visibility:visible}}' in style
+    assert '@keyframes r3{8.333%{visibility:visible}16.667%{visibility:hidden}}' in style
+
+def test_style_table():
+    style_table = svg.StyleTable()
+    attributes = {
+        'color': 'color1', 'bold': True, 'italics': False,
+        'underscore': False, 'strikethrough': False,
+    }
+
+    assert style_table.text_class(attributes) == 'color1 s0'
+    assert style_table.text_class({**attributes, 'bold': False}) == 'color1'
+    assert style_table.text_class({**attributes, 'color': '#123456'}) == 's1'
+    assert style_table.background_class('#123456') == 's2'
+    assert style_table.background_class('color2') == 'color2'
+    assert style_table.css() == (
+        '.s0{font-weight:bold}.s1{fill:#123456;font-weight:bold}.s2{fill:#123456}'
+    )
+    assert [svg.base62(n) for n in (0, 61, 62)] == ['0', 'Z', '10']
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_animation_compact(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 2)
+    records = [
+        AsciiCastV2Event(0.0, 'o', '\x1b[?25l\x1b[1mA\x1b[0m\r\nB'),
+        AsciiCastV2Event(0.1, 'o', '\x1b[HC'),
+    ]
+    output_path = tmp_path / "out.svg"
+
+    core.render_animation(records, header, str(output_path), "gjm8", compact=True)
+
+    root = svg.etree.parse(str(output_path)).getroot()
+    style = root.find(f'.//{{{svg.SVG_NS}}}style[@id="generated-style"]').text
+    assert '.s0{font-weight:bold}' in style
+    # Only the line 'B' is used by both frames
+    defs = root.find(f'.//{{{svg.SVG_NS}}}defs/{{{svg.SVG_NS}}}g/..')
+    assert [group.get('id') for group in defs.iterfind(f'{{{svg.SVG_NS}}}g')] == ['g1']
+    screen_view = root.find(f'.//{{{svg.SVG_NS}}}g[@id="screen_view"]')
+    uses = screen_view.findall(f'.//{{{svg.SVG_NS}}}use')
+    assert [use.get(f'{{{svg.XLINK_NS}}}href') for use in uses] == ['#g1', '#g1']
+    texts = screen_view.findall(f'.//{{{svg.SVG_NS}}}text')
+    assert [(text.text, text.get('class')) for text in texts] == [
+        ('A', 'foreground s0'), ('C', 'foreground')
+    ]
+
+@pytest.mark.parametrize("options", [{}, {"row_lifetimes": True}, {"compact": True}])
+@patch('termcap.renderer.theme.load_template')
+def test_render_animation_incremental(mock_load, mock_template, tmp_path, options):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 3)
+    events = [AsciiCastV2Event(0.1 * i, 'o', f'\x1b[{i % 3 + 1}L{i}\r\n') for i in range(12)]
+    cast_path = tmp_path / "grow.cast"
+    output_path = tmp_path / "grow.svg"
+    cast_path.write_text(header.to_json_line() + '\n')
+
+    for part in (events[:5], events[5:], []):
+        with open(cast_path, 'a') as cast_file:
+            cast_file.writelines(event.to_json_line() + '\n' for event in part)
+        summary = core.render_animation_incremental(
+            str(cast_path), str(output_path), "gjm8", **options
+        )
+
+    assert checkpoint.load(str(tmp_path / "grow.svg.checkpoint")) is not None
+    full_path = tmp_path / "full.svg"
+    full_summary = core.render_animation(events, header, str(full_path), "gjm8", **options)
+    assert summary == full_summary
+    assert output_path.read_bytes() == full_path.read_bytes()
+
+    # Options differ from the checkpoint, the whole cast is rendered again
+    core.render_animation_incremental(str(cast_path), str(output_path), "gjm8", loop_delay=500)
+    core.render_animation(events, header, str(full_path), "gjm8", loop_delay=500)
+    assert output_path.read_bytes() == full_path.read_bytes()
+
+_unpickled = []
+
+def _record_unpickling():
+    _unpickled.append(True)
+
+class _Payload:
+    def __reduce__(self):
+        return _record_unpickling, ()
+
+def test_checkpoint_ignores_other_state_files(tmp_path):
+    (tmp_path / "state.pickle").write_bytes(pickle.dumps(_Payload()))
+    assert checkpoint.load(str(tmp_path)) is None
+    assert not _unpickled
+
+    state_path = tmp_path / checkpoint._STATE_FILE
+    for content in (
+        pickle.dumps(_Payload()),
+        gzip.compress(pickle.dumps(_Payload())),
+        gzip.compress(b'[1, 2]'),
+        gzip.compress(json.dumps({"version": 1, "key": "k"}).encode()),
+    ):
+        state_path.write_bytes(content)
+        assert checkpoint.load(str(tmp_path)) is None
+    assert not _unpickled
+
+def test_keyframe_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(keyframes, "INDEX_DIR", tmp_path / "keyframes")
+    header = AsciiCastV2Header(2, 10, 3)
+    events = [AsciiCastV2Event(float(i), 'o', f'\x1b[{i % 3 + 1}L{i}\r\n') for i in range(20)]
+    cast_path = tmp_path / "long.cast"
+    cast_path.write_text(''.join(line + '\n' for line in
+                                 [header.to_json_line()] + [event.to_json_line() for event in events[:12]]))
+    assert len(keyframes.build_index(str(cast_path), interval=5).keyframes) == 2
+    with open(cast_path, 'a') as cast_file:
+        cast_file.writelines(event.to_json_line() + '\n' for event in events[12:])
+
+    _, screen, window = keyframes.read_window(str(cast_path), 13.5, 16, interval=5)
+    index = keyframes.load_index(str(cast_path), interval=5)
+    assert [keyframe.time for keyframe in index.keyframes] == [5.0, 10.0, 15.0]
+    # An index that cannot be saved is still used
+    with patch.object(keyframes, "INDEX_DIR", tmp_path / "missing" / "keyframes"), \
+            patch('os.makedirs', side_effect=PermissionError):
+        assert len(keyframes.build_index(str(cast_path), interval=5).keyframes) == 3
+
+    # Indexes are stored in the cache directory as JSON
+    with gzip.open(keyframes.index_path(str(cast_path))) as index_file:
+        assert json.load(index_file)["offset"] == index.offset
+
+    expected = core.pyte.Screen(10, 3)
+    core.pyte.Stream(expected).feed(''.join(event.event_data for event in events[:14]))
+    assert screen.display == expected.display
+    assert [(event.time, event.event_data) for event in window] == [
+        (event.time - 13.5, event.event_data) for event in events[14:17]
+    ]
+
+    # Offsets of keyframes in .tcap files count events
+    tcap_path = tmp_path / "long.tcap"
+    tcap.write_tcap(str(tcap_path), header.to_json_line().encode(), events)
+    _, tcap_screen, tcap_window = keyframes.read_window(str(tcap_path), 13.5, 16, interval=5)
+    assert keyframes.load_index(str(tcap_path), interval=5).keyframes[-1].offset == 15
+    assert tcap_screen.display == expected.display
+    assert list(tcap_window) == [event._replace(time=event.time - 13.5) for event in events[14:17]]
+
+def test_between_sequences():
+    stream = core.pyte.Stream(core.pyte.Screen(10, 2))
+    stream.feed('a')
+    assert checkpoint.between_sequences(stream)
+    stream.feed('\x1b[1')
+    assert not checkpoint.between_sequences(stream)
+    # Unknown parser state of another version of pyte
+    del stream._taking_plain_text
+    assert not checkpoint.between_sequences(stream)
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_animations(mock_load, mock_template, tmp_path):
+    templates = {"a": mock_template, "b": mock_template.replace(b'viewBox="0 0 100 100"', b'viewBox="0 0 50 50"')}
+    mock_load.side_effect = templates.get
+
+    header = AsciiCastV2Header(2, 10, 2)
+    events = [AsciiCastV2Event(0.1 * i, 'o', f'{i}\r\n') for i in range(5)]
+    outputs = [(str(tmp_path / f"{name}.svg"), name) for name in templates]
+    summary = core.render_animations(events, header, outputs, compact=True)
+
+    assert summary.frames == 5
+    for path, name in outputs:
+        assert core.render_animation(events, header, str(tmp_path / "single.svg"), name, compact=True) == summary
+        assert (tmp_path / "single.svg").read_bytes() == open(path, 'rb').read()
+    with pytest.raises(ValueError):
+        core.render_animations(events, header, outputs + [(str(tmp_path / "c.svg"), "c")])
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_batch(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 2)
+    jobs = []
+    for name, count in (("small", 2), ("large", 20)):
+        cast_path = tmp_path / f"{name}.cast"
+        cast_path.write_text('\n'.join([header.to_json_line()] + [
+            AsciiCastV2Event(0.1 * i, 'o', str(i)).to_json_line() for i in range(count)
+        ]) + '\n')
+        jobs.append(batch.BatchJob(str(cast_path), str(tmp_path / f"{name}.svg")))
+    (tmp_path / "bad.cast").write_text("not a cast\n")
+    jobs.append(batch.BatchJob(str(tmp_path / "bad.cast"), str(tmp_path / "bad.svg")))
+
+    results = list(batch.render_batch(jobs, "gjm8", {"loop_delay": 500}, use_cache=False))
+    assert [result.job.cast_path for result in results] == [jobs[1].cast_path, jobs[0].cast_path, jobs[2].cast_path]
+    assert [result.summary.frames for result in results[:2]] == [20, 2]
+    assert (tmp_path / "large.svg").exists() and (tmp_path / "small.svg").exists()
+    assert results[2].summary is None and results[2].error.startswith('ValueError')
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_batch_worker_crash(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+    header = AsciiCastV2Header(2, 10, 2)
+    jobs = []
+    for name, count in (("crash", 30), ("a", 3), ("b", 2), ("c", 1)):
+        cast_path = tmp_path / f"{name}.cast"
+        cast_path.write_text('\n'.join([header.to_json_line()] + [
+            AsciiCastV2Event(0.1 * i, 'o', str(i)).to_json_line() for i in range(count)
+        ]) + '\n')
+        jobs.append(batch.BatchJob(str(cast_path), str(tmp_path / f"{name}.svg")))
+
+    render_animation = core.render_animation
+    def render_or_die(records, header, output_path, *args, **kwargs):
+        # Workers are forked, they inherit the patch
+        if output_path.endswith("crash.svg"):
+            os._exit(1)
+        return render_animation(records, header, output_path, *args, **kwargs)
+
+    with patch('termcap.renderer.batch.render_animation', render_or_die):
+        results = {
+            os.path.basename(result.job.cast_path): result
+            for result in batch.render_batch(jobs, "gjm8", workers=2, use_cache=False)
+        }
+    assert len(results) == 4
+    assert results["crash.cast"].summary is None and 'BrokenProcessPool' in results["crash.cast"].error
+    assert all(results[name].error is None for name in ("a.cast", "b.cast", "c.cast"))
+    assert all((tmp_path / f"{name}.svg").exists() for name in "abc")
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_still_frames_with_jobs(mock_load, mock_template, tmp_path):
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 2)
+    records = [AsciiCastV2Event(0.1 * i, 'o', str(i)) for i in range(5)]
+
+    core.render_still_frames(records, header, str(tmp_path / "seq"), "gjm8")
+    summary = core.render_still_frames(records, header, str(tmp_path / "par"), "gjm8", jobs=2)
+
+    names = sorted(p.name for p in (tmp_path / "seq").iterdir())
+    assert summary.frames == len(names) == 5
+    for name in names:
+        assert (tmp_path / "par" / name).read_bytes() == (tmp_path / "seq" / name).read_bytes()
+
+    # Frames showing a screen seen before are not counted as unique
+    records = [AsciiCastV2Event(0.1 * i, 'o', data) for i, data in enumerate(['a', '\x1b[2J\x1b[H', 'a', 'b'])]
+    summary = core.render_still_frames(records, header, str(tmp_path / "repeat"), "gjm8")
+    assert (summary.frames, summary.unique_frames) == (4, 3)
+
+def test_open_output_compression(tmp_path):
+    with compression.open_output(str(tmp_path / "out.svgz"), compress=True) as f:
+        f.write(b'<svg>')
+        f.write(b'</svg>')
+    with compression.open_output(str(tmp_path / "out.svg"), sidecars=('gz',)) as f:
+        f.write(b'<svg/>')
+
+    assert gzip.decompress((tmp_path / "out.svgz").read_bytes()) == b'<svg></svg>'
+    assert (tmp_path / "out.svg").read_bytes() == b'<svg/>'
+    assert gzip.decompress((tmp_path / "out.svg.gz").read_bytes()) == b'<svg/>'
+    for path, options in [
+        ("out.svg", {"sidecars": ('zip',)}),
+        ("out.svg", {"compress": True}),
+        ("out.svgz", {"sidecars": ('gz',)}),
+    ]:
+        with pytest.raises(ValueError):
+            with compression.open_output(str(tmp_path / path), **options):
+                pass
+    assert not (tmp_path / "out.svgz.gz").exists()
+
+def test_render_cache(tmp_path):
+    cast_path = tmp_path / "in.cast"
+    cast_path.write_bytes(b'{"version": 2, "width": 10, "height": 2}\n')
+    key = cache_key(str(cast_path), b'<svg/>', {"loop_delay": 1000})
+    assert key == cache_key(str(cast_path), b'<svg/>', {"loop_delay": 1000})
+    assert key != cache_key(str(cast_path), b'<svg/>', {"loop_delay": 500})
+    assert key != cache_key(str(cast_path), b'<svg></svg>', {"loop_delay": 1000})
+    # The options of render and render-batch for the same animation agree
+    assert animation_options("out.svgz", 10, 200, 500) == animation_options(
+        "out.svgz", min_frame_dur=10, max_frame_dur=200, loop_delay=500, compress=True
+    )
+
+    render_cache = RenderCache(tmp_path / "cache")
+    assert render_cache.get(key) is None
+    output_path = tmp_path / "out.svg"
+    for i, data in enumerate((b'first', b'second', b'third')):
+        output_path.write_bytes(data)
+        os.utime(render_cache.put(str(i), str(output_path)), (i, i))
+    assert render_cache.get("0").read_bytes() == b'first'
+    assert render_cache.size() == 16
+
+    # Entries of a read-only cache are still used
+    with patch("os.utime", side_effect=PermissionError):
+        assert render_cache.get("1").read_bytes() == b'second'
+
+    # "0" was used last, "1" is evicted first
+    removed = render_cache.evict(max_size=11)
+    assert [entry.path.name for entry in removed] == ["1"]
+    assert [entry.path.name for entry in render_cache.entries()] == ["2", "0"]
+    render_cache.clear()
+    assert render_cache.entries() == []
+
+def test_array_frames():
+    pytest.importorskip("numpy")
+    from termcap.renderer import arrays
+
+    red = svg.CharacterCell('a', 'color1', 'background', False, False, False, False)
+    on_blue = svg.CharacterCell('b', 'foreground', 'color4', False, False, False, False)
+    wide = svg.CharacterCell('中', 'color1', 'background', False, False, False, False)
+    tail = svg.CharacterCell('', 'color1', 'background', False, False, False, False)
+    row = {0: red, 1: red, 2: on_blue, 4: wide, 5: tail}
+
+    converter = arrays.FrameConverter(8, 2)
+    first = converter.convert({0: row, 1: {}})
+    second = converter.convert({0: row, 1: {0: red}})
+
+    assert first.codepoints[0][0] == ord('a')
+    assert not first.attributes[1].any()
+    assert arrays.changed_rows(first, second).tolist() == [1]
+    assert first.digest() != second.digest()
+    assert converter.line_runs(second, 0) == svg.line_runs(row)
+
+@patch('termcap.renderer.theme.load_template')
+def test_render_animation_array_frames(mock_load, mock_template, tmp_path):
+    pytest.importorskip("numpy")
+    mock_load.return_value = mock_template
+
+    header = AsciiCastV2Header(2, 10, 4)
+    records = [AsciiCastV2Event(0.1 * i, 'o', f'line {i}\r\n') for i in range(12)]
+    summary = core.render_animation(records, header, str(tmp_path / "lines.svg"), "gjm8")
+    array_summary = core.render_animation(
+        records, header, str(tmp_path / "arrays.svg"), "gjm8", array_frames=True
+    )
+
+    assert array_summary == summary
+    assert (tmp_path / "arrays.svg").read_bytes() == (tmp_path / "lines.svg").read_bytes()